@@ -0,0 +1,119 @@
+import sys
+import threading
+import time
+from concurrent.futures import Future, wait
+from dataclasses import dataclass, asdict, fields
+from functools import partial
+import numpy as np
+import librosa
+
+from common import process_directory_raw, NoiseSuppressor
+from common.corpus_statistics import CsvStatisticsWriter
+from common.noisereduce import signal_spectrogram
+
+
+@dataclass
+class SegmentationComparison:
+    filename: str
+    duration: float
+    agreement: float
+    first_signal_difference_ms: float
+    last_signal_difference_ms: float
+    noise_ratio: float
+    spectral_noise_ratio: float
+    energy_seconds: float
+    spectral_energy_seconds: float
+
+
+def signal_bounds(is_noise):
+    isignal, *_ = np.where(is_noise == False)
+    return isignal[0], isignal[-1]
+
+def compare_file(noise_suppressor: NoiseSuppressor, source_file, _dest_file) -> SegmentationComparison:
+    '''
+    segments the audio, as noise_reduce_signal does, with the sliding window energy
+    and with the energy from the spectrogram, and compares both.
+    '''
+    y, sr = librosa.load(source_file, sr=44100)
+    if len(y) <= sr * 1:
+        raise Exception('Length of audio is too small to be analyzed')
+    y = y - np.mean(y)
+
+    start = time.perf_counter()
+    energy = noise_suppressor.noise_energy(y, sr)
+    energy_seconds = time.perf_counter() - start
+    is_noise, _ = noise_suppressor.noise_sel(y, sr, energy=energy)
+
+    # the spectrogram is not timed: the noise reduction computes it anyway.
+    sig_stft, _ = signal_spectrogram(y, n_fft=2048, hop_length=512, win_length=2048)
+    start = time.perf_counter()
+    spectral_energy = noise_suppressor.spectral_noise_energy(y, sr, sig_stft)
+    spectral_energy_seconds = time.perf_counter() - start
+    spectral_is_noise, _ = noise_suppressor.noise_sel(y, sr, energy=spectral_energy)
+
+    first, last = signal_bounds(is_noise)
+    spectral_first, spectral_last = signal_bounds(spectral_is_noise)
+    return SegmentationComparison(
+        filename = source_file,
+        duration = len(y) / sr,
+        agreement = np.mean(is_noise == spectral_is_noise),
+        first_signal_difference_ms = 1000 * abs(int(first) - int(spectral_first)) / sr,
+        last_signal_difference_ms = 1000 * abs(int(last) - int(spectral_last)) / sr,
+        noise_ratio = np.mean(is_noise),
+        spectral_noise_ratio = np.mean(spectral_is_noise),
+        energy_seconds = energy_seconds,
+        spectral_energy_seconds = spectral_energy_seconds,
+    )
+
+def main(argv):
+    from sys import stdout
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(
+        prog=argv[0],
+        description='Compares the segmentation in noise and signal made with the sliding window energy and with ' +
+                    'the energy taken from the spectrogram (spectral_energy). Writes one csv row per file to stdout ' +
+                    'and fails if any file disagrees more than allowed.',
+        usage='%(prog)s [options] SOURCE [SOURCE ...]',
+    )
+    parser.add_argument('--noise-threshold-pct', type=float, default=0.34)
+    parser.add_argument('--min-agreement', help='smallest fraction of samples classified the same way on every file', type=float, default=0.99)
+    parser.add_argument('--max-edge-ms', help='largest difference of the first or last signal sample, in milliseconds', type=float, default=50.0)
+    parser.add_argument('source', help='files or directories to compare', nargs='+')
+    args = parser.parse_args(argv[1:])
+
+    noise_suppressor = NoiseSuppressor(noise_threshold_pct=args.noise_threshold_pct, intra_file_parallelism=False)
+    writer = CsvStatisticsWriter(stdout, [field.name for field in fields(SegmentationComparison)])
+    comparisons = []
+    lock = threading.Lock()
+
+    def completed_action(file_path: str, future: Future):
+        if future.exception() is not None:
+            print(f'error processing file {file_path}: {future.exception()}', file=sys.stderr)
+            return
+        with lock:
+            comparisons.append(future.result())
+            writer.write(asdict(future.result()))
+
+    futures = process_directory_raw(args.source, None, partial(compare_file, noise_suppressor), completed_action, paths_to_ignore=['.DS_Store', '.asd'])
+    wait(futures)
+    writer.close()
+
+    if len(comparisons) == 0:
+        print('no files compared', file=sys.stderr)
+        return 1
+
+    agreements = [comparison.agreement for comparison in comparisons]
+    edges = [max(comparison.first_signal_difference_ms, comparison.last_signal_difference_ms) for comparison in comparisons]
+    speedup = sum(c.energy_seconds for c in comparisons) / max(sum(c.spectral_energy_seconds for c in comparisons), 1e-9)
+    print(f'{len(comparisons)} files: agreement min {min(agreements):.4f} mean {np.mean(agreements):.4f}, ' +
+          f'edges max {max(edges):.1f}ms median {np.median(edges):.1f}ms, energy {speedup:.1f}x faster', file=sys.stderr)
+
+    failed = [c.filename for c, edge in zip(comparisons, edges) if c.agreement < args.min_agreement or edge > args.max_edge_ms]
+    for filename in failed:
+        print(f'segmentation differs too much on {filename}', file=sys.stderr)
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    from sys import argv, exit
+    exit(main(argv))
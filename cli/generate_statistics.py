@@ -39,16 +39,62 @@ class Statistics:
     f0min: float
     f0max: float
 
+@dataclass
+class SuppressionWithStatistics:
+    source: str
+    statistics: Statistics = None
+    statistics_error: str = None
+
 
 def generate_statistics_of_audio(noise_suppressor: NoiseSuppressor, source_file, _dest_file) -> Statistics:
-    raw_y, sr = librosa.load(source_file, sr=44100)
+    with noise_suppressor.profile_file(source_file):
+        with noise_suppressor.memory_stage('load'):
+            raw_y, sr = librosa.load(source_file, sr=44100)
+        noise_suppressor.observe_audio(raw_y, sr)
+        return statistics_of_signal(noise_suppressor, source_file, raw_y, sr)
 
-    y = noise_suppressor.just_crop_ends(raw_y, sr)
+def suppress_and_generate_statistics(noise_suppressor: NoiseSuppressor, source_file, dest_file) -> SuppressionWithStatistics:
+    '''
+    decodes the audio once, saves it processed to dest_file, like NoiseSuppressor.process_signal_file,
+    and analyzes it like generate_statistics_of_audio. The statistics are still computed when the
+    processing fails, but the file fails as it would alone: its exception is raised, with the
+    statistics in its statistics attribute. A failure of the statistics only is returned in statistics_error.
+    '''
+    suppression_error = None
+    with noise_suppressor.profile_file(source_file):
+        with noise_suppressor.memory_stage('load'):
+            raw_y, sr = librosa.load(source_file, sr=44100)
+        noise_suppressor.observe_audio(raw_y, sr)
+        result = SuppressionWithStatistics(source_file)
+        try:
+            noise_suppressor.process_signal(raw_y, sr, dest_file)
+        except Exception as e:
+            suppression_error = e
+        try:
+            result.statistics = statistics_of_signal(noise_suppressor, source_file, raw_y, sr)
+        except Exception as e:
+            result.statistics_error = str(e)
+    if suppression_error is not None:
+        suppression_error.statistics = result.statistics
+        raise suppression_error
+    return result
+
+def statistics_of_signal(noise_suppressor: NoiseSuppressor, source_file, raw_y, sr) -> Statistics:
+    '''
+    statistics of an already decoded audio. The noise selection of the whole audio
+    is computed once, for both the crop and the f0 statistics, so the fast crop,
+    which only avoids computing it, does not apply here.
+    '''
+    if len(raw_y) <= sr * 1:
+        raise Exception('Length of audio is too small to be analyzed')
+    raw_is_noise, _ = noise_suppressor.noise_sel(raw_y, sr)
+
+    y = noise_suppressor.just_crop_ends(raw_y, sr, raw_is_noise)
     if len(y) <= sr * 1:
         raise Exception('Length of audio is too small to be analyzed')
 
     f0_stats_extractor = F0StatisticsExtractor(**noise_suppressor.__dict__)
-    f0stats = f0_stats_extractor.generate_f0_statistics(raw_y, sr)
+    f0stats = f0_stats_extractor.generate_f0_statistics(raw_y, sr, raw_is_noise)
 
     is_noise, _ = noise_suppressor.noise_sel(y, sr)
     ynoise = y[is_noise]
@@ -69,29 +115,67 @@ def generate_statistics_of_audio(noise_suppressor: NoiseSuppressor, source_file,
     )
 
 def main(argv):
-    import csv
+    import threading
     from sys import stdout
-    from multiprocessing import cpu_count
-    from concurrent.futures import ProcessPoolExecutor
-
-    if len(argv) < 2:
-        print(f'usage: {argv[0]} <file_or_folder_to_analyze> [ <file_or_folder_to_analyze> ... ]')
-        print(f'generates useful statistic on each file ')
-        return -1
-
-    writer = csv.DictWriter(stdout, fieldnames=[field.name for field in fields(Statistics)])
-    writer.writeheader()
+    from argparse import ArgumentParser
+    from common.corpus_statistics import CsvStatisticsWriter, CorpusAggregator, open_statistics_writer
+    from common.batch_options import add_batch_arguments, suppressor_options, batch_options, report_index_selection
+
+    parser = ArgumentParser(
+        prog=argv[0],
+        description='generates useful statistic on each file',
+        usage='%(prog)s [options] <file_or_folder_to_analyze> [ <file_or_folder_to_analyze> ... ]',
+    )
+    parser.add_argument('--output', help='file to write the statistics to, instead of stdout. ' +
+                        'The format is chosen by the extension: .npz, .parquet or csv')
+    parser.add_argument('--row-group-size', help='rows buffered before writing to a columnar output', type=int, default=1024)
+    parser.add_argument('--summary', help='json file where corpus-level statistics are kept, updated as the run progresses')
+    parser.add_argument('--summary-every', help='rewrite the summary after this many processed files', type=int, default=1000)
+    parser.add_argument('--manifest', help='where to write the shard manifest, with --shard (default: <output>.manifest.json). ' +
+                        'Merge the results of the shards with merge_shards.py')
+    add_batch_arguments(parser, min_duration=1.0)
+    parser.add_argument('paths', help='files or folders to analyze', nargs='+')
+    args = parser.parse_args(argv[1:])
+
+    if (args.shard is not None or args.manifest is not None) and args.output is None:
+        parser.error('--shard and --manifest need --output, for the statistics part of the shard that merge_shards.py merges')
+    if args.shard is not None:
+        args.manifest = args.manifest or f'{args.output}.manifest.json'
+
+    fieldnames = [field.name for field in fields(Statistics)]
+    if args.output is None:
+        writer = CsvStatisticsWriter(stdout, fieldnames)
+    else:
+        writer = open_statistics_writer(args.output, fieldnames, args.row_group_size)
+    aggregator = CorpusAggregator(fieldnames) if args.summary else None
+    lock = threading.Lock()
 
     def completed_action(file_path: str, future: Future):
         if future.exception() is not None:
             print(f'error processing file {file_path}: {future.exception()}', file=sys.stderr)
             return
-        writer.writerow(asdict(future.result()))
-
-    noise_suppressor = NoiseSuppressor(noise_suppress=False)
-
-    futures = process_directory_raw(argv[1:], None, partial(generate_statistics_of_audio, noise_suppressor), completed_action, ['.DS_Store', '.asd'])
+        row = asdict(future.result())
+        with lock:
+            writer.write(row)
+            if aggregator is not None:
+                aggregator.add(row)
+                if aggregator.rows % args.summary_every == 0:
+                    aggregator.write_summary(args.summary)
+
+    noise_suppressor = NoiseSuppressor(noise_suppress=False, **suppressor_options(args))
+    options = batch_options(args, args.paths, noise_suppressor, include_f0=True)
+
+    futures = process_directory_raw(args.paths, None, partial(generate_statistics_of_audio, noise_suppressor), completed_action,
+                                    paths_to_ignore=['.DS_Store', '.asd'], **options)
     wait(futures)
+    report_index_selection(options['index'])
+
+    with lock:
+        writer.close()
+        if aggregator is not None:
+            aggregator.write_summary(args.summary)
+    if options['shard'] is not None:
+        options['shard'].write_manifest(args.manifest, args.output)
 
     return 0
 
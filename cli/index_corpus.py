@@ -0,0 +1,44 @@
+import sys
+
+from common.corpus_index import CorpusIndex
+
+
+def main(argv):
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(
+        prog=argv[0],
+        description='Creates or incrementally updates a sqlite index of the audios of a corpus, with durations, ' +
+                    'formats, sample rates and channels read from their headers. Only new or modified files are read.',
+        usage='%(prog)s [options] INDEX PATH [PATH ...]',
+    )
+    parser.add_argument('--list', help='print the indexed files matching the filters, with their durations', action='store_true')
+    parser.add_argument('--min-duration', help='only list files longer than this many seconds', type=float)
+    parser.add_argument('--max-duration', help='only list files up to this many seconds', type=float)
+    parser.add_argument('--format', help='only list files of these formats, e.g. WAV FLAC', nargs='+', dest='formats')
+    parser.add_argument('--samplerate', help='only list files with these sample rates', type=int, nargs='+', dest='samplerates')
+    parser.add_argument('--channels', help='only list files with these amounts of channels', type=int, nargs='+')
+    parser.add_argument('index', help='sqlite file of the index')
+    parser.add_argument('paths', help='files or folders to index', nargs='+')
+    args = parser.parse_args(argv[1:])
+
+    with CorpusIndex(args.index) as index:
+        scan = index.scan(args.paths)
+        print(f'{scan.added} added, {scan.updated} updated, {scan.removed} removed, {scan.unchanged} unchanged, ' +
+              f'{scan.unreadable} unreadable headers', file=sys.stderr)
+
+        filters = {
+            'min_duration': args.min_duration, 'max_duration': args.max_duration,
+            'formats': args.formats, 'samplerates': args.samplerates, 'channels': args.channels,
+        }
+        entries = [entry for path in args.paths for entry in index.query(path, **filters)]
+        if args.list:
+            for entry in entries:
+                print(f'{entry.path},{entry.duration if entry.duration is not None else ""}')
+        total = sum(entry.duration or 0.0 for entry in entries)
+        print(f'{len(entries)} files, {total / 3600:.2f} hours', file=sys.stderr)
+    return 0
+
+if __name__ == '__main__':
+    from sys import argv, exit
+    exit(main(argv))
@@ -0,0 +1,69 @@
+import json
+import time
+import urllib.request
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+from itertools import cycle, islice
+
+import numpy as np
+
+
+def send_request(url: str, body: dict):
+    '''
+    sends a single job. returns the HTTP status and the latency in seconds.
+    '''
+    data = json.dumps(body).encode()
+    request = urllib.request.Request(url, data=data, headers={'Content-Type': 'application/json'})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    return status, time.perf_counter() - start
+
+
+def main():
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(
+        description='Measures the latency and throughput of a running serve.py instance.',
+        usage='%(prog)s [options] AUDIO [AUDIO ...]',
+    )
+    parser.add_argument('--url', default='http://127.0.0.1:8350', help='address of the server')
+    parser.add_argument('--endpoint', default='statistics', choices=['statistics', 'suppress'])
+    parser.add_argument('--requests', default=100, type=int, help='total amount of requests to send')
+    parser.add_argument('--concurrency', default=8, type=int, help='amount of simultaneous clients')
+    parser.add_argument('--dest-dir', default='/tmp', help='where /suppress writes its outputs')
+    parser.add_argument('audios', help='audio files used on the requests, in round robin', nargs='+')
+    args = parser.parse_args()
+
+    url = f'{args.url.rstrip("/")}/{args.endpoint}'
+    bodies = []
+    for i, audio in enumerate(islice(cycle(args.audios), args.requests)):
+        body = {'source': audio}
+        if args.endpoint == 'suppress':
+            body['dest'] = f'{args.dest_dir}/load_test_{i}.wav'
+        bodies.append(body)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(lambda body: send_request(url, body), bodies))
+    elapsed = time.perf_counter() - start
+
+    latencies = np.array([latency for status, latency in results if status == 200])
+    statuses = {}
+    for status, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+
+    print(f'requests: {len(results)} in {elapsed:.2f}s, statuses: {statuses}')
+    print(f'throughput: {len(latencies) / elapsed:.2f} successful requests/s')
+    if len(latencies) > 0:
+        print(f'latency p50: {np.percentile(latencies, 50) * 1000:.1f}ms')
+        print(f'latency p99: {np.percentile(latencies, 99) * 1000:.1f}ms')
+    return 0 if len(latencies) == len(results) else 1
+
+if __name__ == '__main__':
+    from sys import exit
+    exit(main())
@@ -1,4 +1,39 @@
-from common import NoiseSupressor, process_directory
+import sys
+import threading
+from dataclasses import asdict, fields
+from functools import partial
+from common import NoiseSuppressor, process_directory, process_directory_raw
+from common.process_directory import default_callback
+from common.batch_options import add_batch_arguments, suppressor_options, batch_options, report_index_selection
+from common.corpus_statistics import open_statistics_writer
+from generate_statistics import Statistics, suppress_and_generate_statistics
+
+
+def errors_callback(file_path, future_result):
+    ''' only reports errors, to not mess with the progress line. '''
+    if future_result.exception():
+        default_callback(file_path, future_result)
+
+def statistics_callback(writer, lock, quiet, file_path, future_result):
+    '''
+    writes the statistics row of each audio processed by suppress_and_generate_statistics,
+    including the ones whose processing failed.
+    '''
+    if future_result.exception():
+        statistics = getattr(future_result.exception(), 'statistics', None)
+        if statistics is not None:
+            with lock:
+                writer.write(asdict(statistics))
+        default_callback(file_path, future_result)
+        return
+    result = future_result.result()
+    if result.statistics is not None:
+        with lock:
+            writer.write(asdict(result.statistics))
+    else:
+        print(f'no statistics for {file_path}: {result.statistics_error}', file=sys.stderr)
+    if not quiet:
+        print(f'processed {result.source}', file=sys.stderr)
 
 def main():
     from multiprocessing import cpu_count
@@ -15,17 +50,37 @@ def main():
     parser.add_argument('--version', action='version', version='%(prog)s 1.0.0')
     parser.add_argument('--noise-suppress', help='activates noise suppression for the audio processing', action='store_true')
     parser.add_argument('--generate-textgrid', help='generate a noise-signal textgrid for each audio', action='store_true')
+    parser.add_argument('--fast-crop', help='without --noise-suppress, crop the ends without the full energy convolution; same results, faster', action='store_true')
+    parser.add_argument('--spectral-energy', help='with --noise-suppress, find the noise with the energy of the spectrogram of the noise reduction ' +
+                                                  'instead of a separate convolution; see compare_segmentation.py', action='store_true')
     parser.add_argument('--workers', help='parallelize up to max amount of workers', type=int)
-
+    parser.add_argument('--manifest', help='where to write the shard manifest, with --shard (default: DEST_DIR/manifest.<i>-of-<N>.json)')
+    add_batch_arguments(parser)
+    parser.add_argument('--statistics', help='also write the statistics of generate_statistics.py to this file (.npz, .parquet or csv), ' +
+                                             'decoding and analyzing each audio only once')
     parser.add_argument('dest_dir', help='directory to save all processed audio')
     parser.add_argument('source_dir', help='directories to search for audios to process', nargs='+')
 
     args = parser.parse_args()
 
     output_path = args.dest_dir.rstrip('/')
-    noiseprocessor = NoiseSupressor(noise_suppress=args.noise_suppress, generate_textgrid=args.generate_textgrid)
+    noiseprocessor = NoiseSuppressor(noise_suppress=args.noise_suppress, generate_textgrid=args.generate_textgrid, fast_crop=args.fast_crop,
+                                     spectral_energy=args.spectral_energy, **suppressor_options(args))
+    options = batch_options(args, args.source_dir, noiseprocessor, include_f0=args.statistics is not None)
+    callback = errors_callback if args.progress else default_callback
+
+    if args.statistics is None:
+        process_directory(args.source_dir, output_path, noiseprocessor, callback, **options)
+    else:
+        writer = open_statistics_writer(args.statistics, [field.name for field in fields(Statistics)])
+        callback = partial(statistics_callback, writer, threading.Lock(), args.progress)
+        process_directory_raw(args.source_dir, output_path, partial(suppress_and_generate_statistics, noiseprocessor), callback, **options)
+        writer.close()
+    report_index_selection(options['index'])
 
-    process_directory(args.source_dir, output_path, noiseprocessor)
+    shard = options['shard']
+    if shard is not None:
+        shard.write_manifest(args.manifest or f'{output_path}/manifest.{shard.index}-of-{shard.count}.json')
     return 0
 
 if __name__ == '__main__':
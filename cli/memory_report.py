@@ -0,0 +1,51 @@
+import json
+import sys
+
+from common.memory_profile import read_records, memory_report, memory_regressions
+
+
+def main(argv):
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(
+        prog=argv[0],
+        description='Summarizes the records of --memory-profile in bytes per audio second by stage, ' +
+                    'and compares them with a previous report, failing if the memory of a stage grew.',
+        usage='%(prog)s [options] RECORDS [RECORDS ...]',
+    )
+    parser.add_argument('--output', help='json file to write the report to, to be used as a later --baseline')
+    parser.add_argument('--baseline', help='report of a previous run to compare with')
+    parser.add_argument('--max-growth', help='fail if a stage needs this fraction more memory than in the baseline', type=float, default=0.2)
+    parser.add_argument('--check-rss', help='also compare the resident memory, which is noisier than the allocations', action='store_true')
+    parser.add_argument('--min-duration', help='leave out the files up to this many seconds, whose fixed overhead dominates', type=float, default=1.0)
+    parser.add_argument('--include-first', help='also count the first file of each process, which pays for its warm up', action='store_true')
+    parser.add_argument('records', help='json lines files written by --memory-profile', nargs='+')
+    args = parser.parse_args(argv[1:])
+
+    records = read_records(args.records)
+    report = memory_report(records, args.min_duration, skip_first=not args.include_first)
+    failed = sum(record['error'] is not None for record in records)
+    print(f'{len(records)} files, {failed} failed', file=sys.stderr)
+
+    print('stage,files,traced_median,traced_p95,traced_max,rss_median,rss_max')
+    for name, stage in report.items():
+        values = [stage[key] for key in ('traced_median', 'traced_p95', 'traced_max', 'rss_median', 'rss_max')]
+        print(','.join([name, str(stage['files'])] + ['' if value is None else f'{value:.0f}' for value in values]))
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline is None:
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    metrics = ('traced_median', 'traced_p95') + (('rss_median',) if args.check_rss else ())
+    problems = memory_regressions(report, baseline, args.max_growth, metrics)
+    for problem in problems:
+        print(problem, file=sys.stderr)
+    return 1 if problems else 0
+
+if __name__ == '__main__':
+    from sys import argv, exit
+    exit(main(argv))
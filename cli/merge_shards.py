@@ -0,0 +1,60 @@
+import json
+import sys
+from dataclasses import fields
+
+from common.corpus_statistics import open_statistics_writer, read_statistics
+from common.sharding import verify_manifests, rejected_files
+from generate_statistics import Statistics
+
+
+def main(argv):
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(
+        prog=argv[0],
+        description='Merges the statistics parts of a run of generate_statistics.py split with --shard, ' +
+                    'checking that every file of the corpus was processed exactly once.',
+        usage='%(prog)s [--allow-errors] --output MERGED MANIFEST [MANIFEST ...]',
+    )
+    parser.add_argument('--output', help='merged statistics file; .npz, .parquet or csv', required=True)
+    parser.add_argument('--row-group-size', type=int, default=1024)
+    parser.add_argument('--allow-errors', help='files that were processed but failed, like the ones too short to be analyzed, ' +
+                                               'are listed but do not fail the merge', action='store_true')
+    parser.add_argument('manifests', help='manifest of each shard', nargs='+')
+    args = parser.parse_args(argv[1:])
+
+    manifests = []
+    for filename in args.manifests:
+        with open(filename) as f:
+            manifests.append(json.load(f))
+
+    problems = verify_manifests(manifests, args.allow_errors)
+    if args.allow_errors:
+        for entry in rejected_files(manifests):
+            print(f'{entry["path"]} was rejected: {entry["error"]}', file=sys.stderr)
+
+    fieldnames = [field.name for field in fields(Statistics)]
+    expected = {entry['source'] for manifest in manifests for entry in manifest['files'] if entry['status'] == 'ok'}
+    found = set()
+
+    writer = open_statistics_writer(args.output, fieldnames, args.row_group_size)
+    for manifest in manifests:
+        if manifest['statistics_part'] is None:
+            problems.append(f'shard {manifest["shard"]} has no statistics part')
+            continue
+        for row in read_statistics(manifest['statistics_part']):
+            found.add(str(row['filename']))
+            writer.write(row)
+    writer.close()
+
+    for source in sorted(expected - found):
+        problems.append(f'{source} is missing from the statistics parts')
+
+    for problem in problems:
+        print(problem, file=sys.stderr)
+    print(f'merged {len(found)} files from {len(manifests)} shards into {args.output}', file=sys.stderr)
+    return 1 if problems else 0
+
+if __name__ == '__main__':
+    from sys import argv, exit
+    exit(main(argv))
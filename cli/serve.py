@@ -0,0 +1,276 @@
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import asdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from queue import Empty, Full, Queue
+from typing import List, Tuple
+
+from common import NoiseSuppressor
+from generate_statistics import generate_statistics_of_audio
+
+
+# the NoiseSuppressor options a client can set. The others configure the server's workers
+# (intra_file_parallelism, memory_profiler), and are not for the clients to choose.
+CLIENT_OPTIONS = ('noise_threshold_db', 'noise_threshold_pct', 'bool_filter_window_size', 'std_threshold',
+                  'suppresion_pct', 'noise_suppress', 'generate_textgrid', 'fast_crop', 'spectral_energy')
+
+
+def invalid_options(options) -> str:
+    ''' why the options of a request cannot be used, or None if they can. '''
+    if not isinstance(options, dict):
+        return 'options must be an object'
+    unknown = sorted(set(options) - set(CLIENT_OPTIONS))
+    if unknown:
+        return f'unknown options {", ".join(unknown)}; the options are {", ".join(CLIENT_OPTIONS)}'
+    return None
+
+
+def warm_up_worker():
+    '''
+    runs once on each worker when it is created, so the first request
+    does not pay for the heavy imports.
+    '''
+    import librosa
+    import soundfile
+
+
+def run_job(kind: str, params: dict):
+    options = params.get('options', {})
+    error = invalid_options(options)
+    if error is not None:
+        raise Exception(error)
+    noise_suppressor = NoiseSuppressor(**options)
+    if kind == 'suppress':
+        return {'processed': noise_suppressor.process_signal_file(params['source'], params['dest'])}
+    if kind == 'statistics':
+        stats = generate_statistics_of_audio(noise_suppressor, params['source'], None)
+        return {key: value if isinstance(value, str) else float(value) for key, value in asdict(stats).items()}
+    raise Exception(f'unknown job kind {kind}')
+
+
+def run_batch(jobs: List[Tuple[str, dict]]) -> List[Tuple[bool, object]]:
+    '''
+    processes a batch of jobs in a single worker, returning (ok, result_or_error)
+    for each one of them. An error on a job does not affect the others.
+    '''
+    results = []
+    for kind, params in jobs:
+        try:
+            results.append((True, run_job(kind, params)))
+        except Exception as e:
+            results.append((False, str(e)))
+    return results
+
+
+class PendingJob:
+    def __init__(self, kind: str, params: dict):
+        self.kind = kind
+        self.params = params
+        self.done = threading.Event()
+        self.ok = False
+        self.result = None
+
+    def finish(self, ok, result):
+        self.ok = ok
+        self.result = result
+        self.done.set()
+
+
+class BatchingDispatcher:
+
+    def __init__(self, workers: int, queue_size: int, batch_size: int, batch_wait: float, batch_max_bytes: int):
+        """
+            Keeps a warm pool of workers, and feeds it batches of jobs.
+
+            workers:
+                amount of processes in the pool.
+
+            queue_size:
+                how many jobs can wait for a worker. When the queue is full, new jobs are refused.
+
+            batch_size:
+                maximum amount of jobs sent to a worker at once.
+
+            batch_wait:
+                how long, in seconds, we wait for more jobs to fill a batch.
+
+            batch_max_bytes:
+                files bigger than this are always processed alone.
+        """
+        self.queue = Queue(maxsize=queue_size)
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.batch_max_bytes = batch_max_bytes
+
+        # at most two batches per worker are inside the pool. The rest waits on the queue,
+        # which is what makes the queue fill up when we are overloaded.
+        self.in_flight = threading.Semaphore(2 * workers)
+        self.pool = ProcessPoolExecutor(max_workers=workers, initializer=warm_up_worker)
+        for _ in range(workers):
+            self.pool.submit(time.sleep, 0)
+
+        self.running = True
+        self.thread = threading.Thread(target=self.__dispatch_loop, daemon=True)
+        self.thread.start()
+
+    def submit(self, kind: str, params: dict) -> PendingJob:
+        ''' enqueues a job. raises queue.Full if there is no space left. '''
+        job = PendingJob(kind, params)
+        self.queue.put_nowait(job)
+        return job
+
+    def shutdown(self):
+        self.running = False
+        self.thread.join()
+        self.pool.shutdown(wait=True)
+
+    def __is_small(self, job: PendingJob):
+        try:
+            return os.path.getsize(job.params['source']) <= self.batch_max_bytes
+        except (OSError, KeyError):
+            return True
+
+    def __next_batch(self):
+        try:
+            first = self.queue.get(timeout=0.1)
+        except Empty:
+            return []
+
+        batch = [first]
+        if not self.__is_small(first):
+            return batch
+
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                job = self.queue.get(timeout=max(remaining, 0)) if remaining > 0 else self.queue.get_nowait()
+            except Empty:
+                break
+            if not self.__is_small(job):
+                self.__send([job])
+                continue
+            batch.append(job)
+        return batch
+
+    def __send(self, batch: List[PendingJob]):
+        self.in_flight.acquire()
+        try:
+            future = self.pool.submit(run_batch, [(job.kind, job.params) for job in batch])
+        except Exception as e:
+            self.in_flight.release()
+            for job in batch:
+                job.finish(False, str(e))
+            return
+
+        def completed_action(future: Future):
+            self.in_flight.release()
+            if future.exception() is not None:
+                for job in batch:
+                    job.finish(False, str(future.exception()))
+                return
+            for job, (ok, result) in zip(batch, future.result()):
+                job.finish(ok, result)
+
+        future.add_done_callback(completed_action)
+
+    def __dispatch_loop(self):
+        while self.running:
+            batch = self.__next_batch()
+            if batch:
+                self.__send(batch)
+
+
+def make_handler(dispatcher: BatchingDispatcher, timeout: float):
+
+    class RequestHandler(BaseHTTPRequestHandler):
+
+        def do_POST(self):
+            kind = self.path.strip('/')
+            if kind not in ('suppress', 'statistics'):
+                return self.__reply(404, {'error': f'unknown endpoint {self.path}'})
+
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                params = json.loads(self.rfile.read(length) or b'{}')
+            except ValueError as e:
+                return self.__reply(400, {'error': f'invalid request: {e}'})
+
+            if not isinstance(params, dict) or 'source' not in params or (kind == 'suppress' and 'dest' not in params):
+                return self.__reply(400, {'error': 'missing source/dest'})
+            error = invalid_options(params.get('options', {}))
+            if error is not None:
+                return self.__reply(400, {'error': error})
+
+            try:
+                job = dispatcher.submit(kind, params)
+            except Full:
+                return self.__reply(503, {'error': 'server is busy'}, {'Retry-After': '1'})
+
+            if not job.done.wait(timeout):
+                return self.__reply(504, {'error': 'timed out waiting for the job'})
+            if not job.ok:
+                return self.__reply(500, {'error': job.result})
+            return self.__reply(200, job.result)
+
+        def do_GET(self):
+            if self.path.strip('/') != 'health':
+                return self.__reply(404, {'error': f'unknown endpoint {self.path}'})
+            return self.__reply(200, {'queued': dispatcher.queue.qsize()})
+
+        def log_message(self, format, *args):
+            pass
+
+        def __reply(self, status, body, headers={}):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            for key, value in headers.items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+    return RequestHandler
+
+
+def main():
+    from multiprocessing import cpu_count
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(
+        description='Keeps a warm pool of workers to suppress noise and generate statistics of audios.\n' +
+                    'Receives jobs over HTTP: POST /suppress {"source", "dest", "options"} ' +
+                    'and POST /statistics {"source", "options"}.',
+    )
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on')
+    parser.add_argument('--port', default=8350, type=int, help='port to listen on')
+    parser.add_argument('--workers', default=cpu_count(), type=int, help='amount of worker processes')
+    parser.add_argument('--queue-size', default=256, type=int, help='jobs waiting for a worker before refusing new ones')
+    parser.add_argument('--batch-size', default=8, type=int, help='maximum amount of small jobs processed together')
+    parser.add_argument('--batch-wait', default=0.005, type=float, help='seconds to wait for a batch to fill')
+    parser.add_argument('--batch-max-bytes', default=1 << 20, type=int, help='files bigger than this are never batched')
+    parser.add_argument('--timeout', default=600, type=float, help='seconds a request waits for its job')
+    args = parser.parse_args()
+
+    dispatcher = BatchingDispatcher(args.workers, args.queue_size, args.batch_size, args.batch_wait, args.batch_max_bytes)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(dispatcher, args.timeout))
+    server.daemon_threads = True
+    print(f'listening on http://{args.host}:{args.port}', file=sys.stderr)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        dispatcher.shutdown()
+    return 0
+
+if __name__ == '__main__':
+    from sys import exit
+    exit(main())
@@ -0,0 +1,61 @@
+import sys
+import threading
+from concurrent.futures import Future, wait
+from dataclasses import asdict, fields
+from functools import partial
+
+from common import process_directory_raw
+from common.corpus_statistics import CsvStatisticsWriter
+from common.parameter_sweep import ParameterSweep, SweepResult
+
+
+def sweep_file(sweep: ParameterSweep, save_outputs: bool, source_file, dest_file):
+    return sweep.sweep_file(source_file, dest_file if save_outputs else None)
+
+
+def main():
+    from sys import stdout
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(
+        description='Runs the noise suppression over every combination of the given parameters, ' +
+                    'reusing the spectra and energies that do not depend on each parameter. ' +
+                    'Writes one csv row per file and setting to stdout.',
+        usage='%(prog)s [options] SOURCE [SOURCE ...]',
+    )
+    parser.add_argument('--noise-threshold-db', type=float, nargs='+')
+    parser.add_argument('--noise-threshold-pct', type=float, nargs='+')
+    parser.add_argument('--bool-filter-window-size', type=int, nargs='+')
+    parser.add_argument('--std-threshold', type=float, nargs='+')
+    parser.add_argument('--suppression-pct', dest='suppresion_pct', type=float, nargs='+')
+    parser.add_argument('--dest-dir', help='if given, saves the audio of each setting as <name>.sweep<setting>.wav')
+    parser.add_argument('source', help='files or directories to sweep', nargs='+')
+    args = parser.parse_args()
+
+    grid = {
+        name: values for name, values in vars(args).items()
+        if name not in ('dest_dir', 'source') and values is not None
+    }
+    sweep = ParameterSweep(grid)
+    for i, setting in enumerate(sweep.settings):
+        print(f'setting {i}: {setting}', file=sys.stderr)
+
+    writer = CsvStatisticsWriter(stdout, [field.name for field in fields(SweepResult)])
+    lock = threading.Lock()
+
+    def completed_action(file_path: str, future: Future):
+        if future.exception() is not None:
+            print(f'error processing file {file_path}: {future.exception()}', file=sys.stderr)
+            return
+        with lock:
+            for result in future.result():
+                writer.write(asdict(result))
+
+    output_path = args.dest_dir.rstrip('/') if args.dest_dir else None
+    futures = process_directory_raw(args.source, output_path, partial(sweep_file, sweep, output_path is not None), completed_action, paths_to_ignore=['.DS_Store', '.asd'])
+    wait(futures)
+    return 0
+
+if __name__ == '__main__':
+    from sys import exit
+    exit(main())
@@ -0,0 +1,52 @@
+import sys
+import threading
+from concurrent.futures import Future, wait
+from functools import partial
+
+from common import process_directory_raw
+from common.wav2f0stats import wav2f0stats, format_line
+
+
+def f0stats_of_file(noise_threshold: float, source_file, _dest_file):
+    return format_line(source_file, wav2f0stats(source_file, noise_threshold))
+
+
+def main(argv):
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(
+        prog=argv[0],
+        description='Runs wav2f0stats over many wav files in a single process pool, writing the same ' +
+                    'line per file (filename,median,mean,std,min,max) to stdout.',
+        usage='%(prog)s [options] THRESHOLD_DB PATH [PATH ...]',
+    )
+    parser.add_argument('--in-order', help='write the lines in the order the files were found, instead of as they finish', action='store_true')
+    parser.add_argument('threshold', help='noise threshold in dB above the noise floor, as in wav2f0stats', type=float)
+    parser.add_argument('paths', help='wav files or folders to analyze', nargs='+')
+    args = parser.parse_args(argv[1:])
+
+    lock = threading.Lock()
+    failed = []
+
+    def completed_action(file_path: str, future: Future):
+        if future.exception() is not None:
+            print(f'error processing file {file_path}: {future.exception()}', file=sys.stderr)
+            with lock:
+                failed.append(file_path)
+        elif not args.in_order:
+            with lock:
+                print(future.result(), flush=True)
+
+    futures = process_directory_raw(args.paths, None, partial(f0stats_of_file, args.threshold), completed_action, paths_to_ignore=['.DS_Store', '.asd'])
+    wait(futures)
+
+    if args.in_order:
+        for future in futures:
+            if future.exception() is None:
+                print(future.result())
+
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    from sys import argv, exit
+    exit(main(argv))
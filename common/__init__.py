@@ -1,3 +1,4 @@
 from .noise_suppressor import NoiseSuppressor
 from .f0stats import F0StatisticsExtractor, F0Statistics
-from .process_directory import process_directory, process_directory_raw
\ No newline at end of file
+from .process_directory import process_directory, process_directory_raw, iter_process_directory, iter_process_directory_raw, aiter_process_directory_raw
+from .streaming_segmenter import StreamingSegmenter
\ No newline at end of file
@@ -0,0 +1,91 @@
+import sys
+from argparse import ArgumentParser
+
+from .sharding import Shard
+from .telemetry import Telemetry
+from .memory_governor import MemoryGovernor, parse_size
+from .supervised_pool import Supervision
+from .corpus_index import CorpusIndex
+from .memory_profile import MemoryProfiler
+
+
+def add_batch_arguments(parser: ArgumentParser, min_duration: float = None):
+    '''
+    adds the options shared by the batch runners (main.py and generate_statistics.py): sharding,
+    progress telemetry, memory budget, supervision, corpus index, intra-file parallelism and
+    memory profiling. min_duration is the default of --min-duration.
+    Use suppressor_options and batch_options to build what they describe.
+    '''
+    parser.add_argument('--shard', help='only process the part i/N of the files, for running on N nodes')
+    parser.add_argument('--balance-by-duration', help='partition the shards by audio duration instead of by path hash', action='store_true')
+
+    parser.add_argument('--progress', help='show a status line with rates, queue and workers on stderr', action='store_true')
+    parser.add_argument('--metrics-file', help='prometheus textfile with the progress of the run, rewritten periodically')
+    parser.add_argument('--metrics-interval', help='seconds between progress reports', type=float, default=5.0)
+
+    parser.add_argument('--memory-budget', help='only process files together while their estimated memory fits this size, e.g. 16G')
+    parser.add_argument('--memory-factor', help='peak bytes per audio sample used for the estimates. Measured at startup if not given', type=float)
+    parser.add_argument('--retries', help='run a file again up to this many times if its worker crashes or hangs', type=int)
+    parser.add_argument('--job-timeout', help='kill a worker that takes more than this many seconds on a file', type=float)
+    parser.add_argument('--quarantine-file', help='json lines file with the files that failed on every retry')
+
+    parser.add_argument('--index', help='sqlite index of the corpus, updated incrementally and used to select and schedule the files without opening them')
+    parser.add_argument('--min-duration', help='with --index, only process files longer than this many seconds' +
+                        ('' if min_duration is None else f' (default: {min_duration})'), type=float, default=min_duration)
+    parser.add_argument('--max-duration', help='with --index, only process files up to this many seconds', type=float)
+
+    parser.add_argument('--intra-file-parallelism', help='split the processing of audios much longer than the others in chunks, ' +
+                                                         'over the threads the idle cores allow', action='store_true')
+    parser.add_argument('--memory-profile', help='append the memory allocated by each stage of each file to this json lines file; see memory_report.py')
+
+
+def suppressor_options(args) -> dict:
+    ''' the NoiseSuppressor options given by the arguments of add_batch_arguments. '''
+    return {
+        'intra_file_parallelism': args.intra_file_parallelism,
+        'memory_profiler': args.memory_profile and MemoryProfiler(args.memory_profile),
+    }
+
+
+def batch_options(args, paths, noise_suppressor, include_f0: bool = False) -> dict:
+    '''
+    the shard, telemetry, governor, supervision and index given by the arguments of add_batch_arguments,
+    as keyword arguments of process_directory_raw. The governor is calibrated with noise_suppressor
+    (and the f0 extraction, with include_f0), and the index is updated with paths.
+    '''
+    shard = None if args.shard is None else Shard.from_spec(args.shard, args.balance_by_duration)
+
+    telemetry = None
+    if args.progress or args.metrics_file:
+        telemetry = Telemetry(args.metrics_file, args.metrics_interval, args.progress)
+
+    governor = None
+    if args.memory_budget is not None:
+        budget = parse_size(args.memory_budget)
+        if args.memory_factor is None:
+            governor = MemoryGovernor.calibrated(budget, noise_suppressor, include_f0=include_f0)
+        else:
+            governor = MemoryGovernor(budget, args.memory_factor)
+
+    supervision = None
+    if args.retries is not None or args.job_timeout is not None or args.quarantine_file is not None:
+        supervision = Supervision(args.retries if args.retries is not None else 2, args.job_timeout, args.quarantine_file)
+
+    index = None
+    if args.index is not None:
+        corpus_index = CorpusIndex(args.index)
+        scan = corpus_index.scan(paths)
+        print(f'index: {scan.added} added, {scan.updated} updated, {scan.removed} removed, {scan.unchanged} unchanged', file=sys.stderr)
+        index = corpus_index.selection(min_duration=args.min_duration, max_duration=args.max_duration)
+
+    return {'shard': shard, 'telemetry': telemetry, 'governor': governor, 'supervision': supervision, 'index': index}
+
+
+def report_index_selection(index):
+    ''' tells which files of the index selection were not checked or skipped by their duration. '''
+    if index is None:
+        return
+    if index.excluded:
+        print(f'{index.excluded} files were skipped by their duration', file=sys.stderr)
+    if index.unreadable:
+        print(f'{index.unreadable} files had no readable header, so their duration was not checked', file=sys.stderr)
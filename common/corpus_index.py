@@ -0,0 +1,236 @@
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from os.path import abspath
+from pathlib import Path
+from typing import List, Tuple
+import soundfile as sf
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS audio_files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    format TEXT,
+    subtype TEXT,
+    samplerate INTEGER,
+    channels INTEGER,
+    frames INTEGER,
+    duration REAL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS audio_files_duration ON audio_files (duration);
+'''
+
+_COLUMNS = 'path, size, mtime_ns, format, subtype, samplerate, channels, frames, duration, error'
+
+
+@dataclass
+class IndexEntry:
+    path: str
+    size: int
+    mtime_ns: int
+    format: str
+    subtype: str
+    samplerate: int
+    channels: int
+    frames: int
+    duration: float
+    error: str
+
+
+@dataclass
+class ScanResult:
+    added: int = 0
+    updated: int = 0
+    removed: int = 0
+    unchanged: int = 0
+    unreadable: int = 0
+
+
+def _read_header(path: str, size: int, mtime_ns: int) -> IndexEntry:
+    try:
+        info = sf.info(path)
+    except Exception as e:
+        return IndexEntry(path, size, mtime_ns, None, None, None, None, None, None, str(e))
+    return IndexEntry(path, size, mtime_ns, info.format, info.subtype, info.samplerate, info.channels, info.frames, info.duration, None)
+
+
+def _walk(root: str):
+    ''' yields (path, stat) of every file under root, without following links to directories. '''
+    stack = [root]
+    while stack:
+        try:
+            iterator = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with iterator:
+            for entry in iterator:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file():
+                        yield entry.path, entry.stat()
+                except OSError:
+                    continue
+
+
+def _under(root: str) -> Tuple[str, tuple]:
+    ''' sql condition and arguments for the paths equal to or inside root. '''
+    prefix = root.rstrip(os.sep) + os.sep
+    escaped = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return "(path = ? OR path LIKE ? ESCAPE '\\')", (root, escaped + '%')
+
+
+class CorpusIndex:
+
+    def __init__(self, filename: str, header_readers: int = 16):
+        """
+            A sqlite index of the audio files of a corpus, with their size, modification time,
+            and format, sample rate, channels, frames and duration read from their headers.
+
+            scan updates it incrementally: only new or modified files (by size and mtime) have
+            their headers read again, and files that disappeared are removed. The batch runners
+            then select and schedule files from it without reading them (see selection).
+            Files whose header cannot be read are kept with the error, so they are not
+            read again until they change.
+        """
+        self.filename = filename
+        self.header_readers = header_readers
+        self.connection = sqlite3.connect(filename)
+        self.connection.executescript(_SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+        return False
+
+    def scan(self, paths: List[str]) -> ScanResult:
+        result = ScanResult()
+        for search_path in paths:
+            root = abspath(search_path)
+            condition, arguments = _under(root)
+            known = {
+                path: (size, mtime_ns)
+                for path, size, mtime_ns in self.connection.execute(f'SELECT path, size, mtime_ns FROM audio_files WHERE {condition}', arguments)
+            }
+
+            if os.path.isfile(root):
+                found = [(root, os.stat(root))]
+            else:
+                found = _walk(root)
+
+            changed = []
+            seen = set()
+            for path, stat in found:
+                seen.add(path)
+                previous = known.get(path)
+                if previous == (stat.st_size, stat.st_mtime_ns):
+                    result.unchanged += 1
+                    continue
+                if previous is None:
+                    result.added += 1
+                else:
+                    result.updated += 1
+                changed.append((path, stat.st_size, stat.st_mtime_ns))
+
+            # reading headers is mostly waiting on the disk, so they are read concurrently
+            with ThreadPoolExecutor(max_workers=self.header_readers) as executor:
+                entries = list(executor.map(lambda file: _read_header(*file), changed))
+            result.unreadable += sum(entry.error is not None for entry in entries)
+
+            removed = [(path,) for path in known.keys() - seen]
+            result.removed += len(removed)
+
+            with self.connection:
+                self.connection.executemany(
+                    f'INSERT OR REPLACE INTO audio_files ({_COLUMNS}) VALUES ({", ".join("?" * 10)})',
+                    [tuple(vars(entry).values()) for entry in entries],
+                )
+                self.connection.executemany('DELETE FROM audio_files WHERE path = ?', removed)
+        return result
+
+    def query(self, root: str = None, min_duration: float = None, max_duration: float = None,
+              formats: List[str] = None, samplerates: List[int] = None, channels: List[int] = None) -> List[IndexEntry]:
+        '''
+        entries under root (every entry if None) matching all the given filters, sorted by path.
+        min_duration is exclusive: only files longer than it match.
+        Files whose header could not be read may still be decoded by librosa, so their unknown
+        duration matches the duration filters, but not the format, samplerate or channels ones.
+        '''
+        conditions, arguments = [], []
+        if root is not None:
+            condition, condition_arguments = _under(abspath(root))
+            conditions.append(condition)
+            arguments.extend(condition_arguments)
+        if min_duration is not None:
+            conditions.append('(duration IS NULL OR duration > ?)')
+            arguments.append(min_duration)
+        if max_duration is not None:
+            conditions.append('(duration IS NULL OR duration <= ?)')
+            arguments.append(max_duration)
+        for column, values in (('format', formats), ('samplerate', samplerates), ('channels', channels)):
+            if values:
+                conditions.append(f'{column} IN ({", ".join("?" * len(values))})')
+                arguments.extend(values)
+
+        where = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+        rows = self.connection.execute(f'SELECT {_COLUMNS} FROM audio_files {where} ORDER BY path', arguments)
+        return [IndexEntry(*row) for row in rows]
+
+    def selection(self, **filters):
+        ''' the files matching the filters of query, to be given to process_directory_raw. '''
+        return IndexSelection(self, filters)
+
+
+class IndexSelection:
+
+    def __init__(self, index: CorpusIndex, filters: dict):
+        """
+            Files of a CorpusIndex matching some filters (see CorpusIndex.query).
+            entries lists them the way path_iterator and relative_path_iterator would
+            find them, with the durations from the index.
+        """
+        self.index = index
+        self.filters = filters
+        self.excluded = 0
+        self.unreadable = 0
+
+    def entries(self, paths: List[str], output_path: str, paths_to_ignore: list) -> List[Tuple[str, str, str, float]]:
+        '''
+        (relative_path, source_path, dest_path, duration) of each selected file, with the same
+        paths path_iterator and relative_path_iterator would give. The output directories are created.
+        duration is None for files whose header could not be read; they are counted in unreadable.
+        '''
+        entries = []
+        directories = set()
+        self.excluded = 0
+        self.unreadable = 0
+        for search_path in paths:
+            if any(x in str(search_path) for x in paths_to_ignore):
+                continue
+            root = Path(abspath(search_path))
+            is_file = root.is_file()
+            selected = self.index.query(str(root), **self.filters)
+            self.excluded += len(self.index.query(str(root))) - len(selected)
+
+            for entry in selected:
+                relative = Path(entry.path).relative_to(root)
+                source = search_path if is_file else Path(search_path) / relative
+                if any(x in str(source) for x in paths_to_ignore):
+                    continue
+                just_name = Path(entry.path).name.split('.')[0]
+                sub_output_path = output_path if is_file or output_path is None else f'{output_path}/{relative.parent}'
+                if sub_output_path is not None and sub_output_path not in directories:
+                    os.makedirs(sub_output_path, exist_ok=True)
+                    directories.add(sub_output_path)
+                relative_path = root.name if is_file else f'{root.name}/{relative.as_posix()}'
+                self.unreadable += entry.duration is None
+                entries.append((relative_path, source, f'{sub_output_path}/{just_name}.cleaned.wav', entry.duration))
+        return entries
@@ -0,0 +1,334 @@
+import csv
+import json
+import math
+import numbers
+import zipfile
+from typing import Dict, Iterator, List
+import numpy as np
+
+
+class CsvStatisticsWriter:
+    '''
+    writes one row per line, the same format generate_statistics always had.
+    With close_file, the file is closed by close, otherwise it is only flushed.
+    '''
+
+    def __init__(self, file, fieldnames: List[str], close_file: bool = False):
+        self.file = file
+        self.close_file = close_file
+        self.writer = csv.DictWriter(file, fieldnames=fieldnames)
+        self.writer.writeheader()
+
+    def write(self, row: dict):
+        self.writer.writerow(row)
+
+    def close(self):
+        if self.close_file:
+            self.file.close()
+        else:
+            self.file.flush()
+
+
+class ColumnarStatisticsWriter:
+
+    def __init__(self, filename: str, fieldnames: List[str], row_group_size: int = 1024):
+        """
+            Base for the columnar writers. Rows are buffered as columns and written
+            to the file in row groups of row_group_size rows, so we never hold
+            more than a row group in memory.
+        """
+        self.filename = filename
+        self.fieldnames = fieldnames
+        self.row_group_size = row_group_size
+        self.row_groups = 0
+        self.columns = {name: [] for name in fieldnames}
+
+    def write(self, row: dict):
+        for name in self.fieldnames:
+            self.columns[name].append(row[name])
+        if len(self.columns[self.fieldnames[0]]) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        if len(self.columns[self.fieldnames[0]]) == 0:
+            return
+        self._write_row_group({name: _column_array(values) for name, values in self.columns.items()})
+        self.row_groups += 1
+        self.columns = {name: [] for name in self.fieldnames}
+
+    def close(self):
+        self.flush()
+
+    def _write_row_group(self, columns: Dict[str, np.ndarray]):
+        raise NotImplementedError
+
+
+def _column_array(values: list) -> np.ndarray:
+    ''' the values of a column as an array. Objects, like the Path of each file, are written as strings. '''
+    values = np.asarray(values)
+    return values.astype(str) if values.dtype == object else values
+
+
+class NpzStatisticsWriter(ColumnarStatisticsWriter):
+    """
+        Writes the statistics to a .npz file. Each row group is stored as one
+        array per column, named '<column>/<row group index>'.
+        Use read_npz_statistics to get the concatenated columns back.
+    """
+
+    def __init__(self, filename: str, fieldnames: List[str], row_group_size: int = 1024):
+        super().__init__(filename, fieldnames, row_group_size)
+        # truncates any previous file
+        with zipfile.ZipFile(filename, mode='w'):
+            pass
+
+    def _write_row_group(self, columns: Dict[str, np.ndarray]):
+        with zipfile.ZipFile(self.filename, mode='a', compression=zipfile.ZIP_DEFLATED) as zf:
+            for name, values in columns.items():
+                with zf.open(f'{name}/{self.row_groups:06d}.npy', mode='w', force_zip64=True) as f:
+                    np.lib.format.write_array(f, values, allow_pickle=False)
+
+
+def read_npz_statistics(filename: str) -> Dict[str, np.ndarray]:
+    ''' reads a file written by NpzStatisticsWriter, returning one array per column. '''
+    groups = {}
+    with np.load(filename) as data:
+        for key in sorted(data.files):
+            name, _ = key.rsplit('/', 1)
+            groups.setdefault(name, []).append(data[key])
+    return {name: np.concatenate(values) for name, values in groups.items()}
+
+
+class ParquetStatisticsWriter(ColumnarStatisticsWriter):
+    ''' writes the statistics to a parquet file, with one parquet row group per row group. Needs pyarrow. '''
+
+    def __init__(self, filename: str, fieldnames: List[str], row_group_size: int = 1024):
+        super().__init__(filename, fieldnames, row_group_size)
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise Exception('pyarrow is needed to write parquet files. Install it or use the .npz output')
+        self.pa = pyarrow
+        self.writer = None
+
+    def _write_row_group(self, columns: Dict[str, np.ndarray]):
+        table = self.pa.table(columns)
+        if self.writer is None:
+            self.writer = self.pa.parquet.ParquetWriter(self.filename, table.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        super().close()
+        if self.writer is not None:
+            self.writer.close()
+
+
+def open_statistics_writer(output: str, fieldnames: List[str], row_group_size: int = 1024):
+    '''
+    chooses the writer by the extension of output: .npz, .parquet, or csv for anything else.
+    '''
+    if output.endswith('.npz'):
+        return NpzStatisticsWriter(output, fieldnames, row_group_size)
+    if output.endswith('.parquet'):
+        return ParquetStatisticsWriter(output, fieldnames, row_group_size)
+    return CsvStatisticsWriter(open(output, 'w', newline=''), fieldnames, close_file=True)
+
+
+def _parse_csv_value(value: str):
+    for kind in (int, float):
+        try:
+            return kind(value)
+        except ValueError:
+            pass
+    return value
+
+
+def read_statistics(filename: str) -> Iterator[dict]:
+    '''
+    reads back the rows of a file written by any of the statistics writers.
+    '''
+    if filename.endswith('.npz') or filename.endswith('.parquet'):
+        if filename.endswith('.npz'):
+            columns = read_npz_statistics(filename)
+        else:
+            import pyarrow.parquet
+            columns = pyarrow.parquet.read_table(filename).to_pydict()
+        names = list(columns)
+        for values in zip(*(columns[name] for name in names)):
+            yield {name: value.item() if isinstance(value, np.generic) else value for name, value in zip(names, values)}
+        return
+
+    with open(filename, newline='') as f:
+        for row in csv.DictReader(f):
+            yield {name: _parse_csv_value(value) for name, value in row.items()}
+
+
+class QuantileSketch:
+
+    def __init__(self, size: int = 1024, seed: int = 0):
+        """
+            Approximate quantiles over a stream using a fixed-size uniform sample
+            (reservoir sampling). Memory is bounded by size, and the quantiles
+            are exact while we saw less than size values.
+        """
+        self.size = size
+        self.count = 0
+        self.reservoir = np.empty(size)
+        self.rng = np.random.default_rng(seed)
+
+    def add(self, value: float):
+        if self.count < self.size:
+            self.reservoir[self.count] = value
+        else:
+            j = self.rng.integers(0, self.count + 1)
+            if j < self.size:
+                self.reservoir[j] = value
+        self.count += 1
+
+    def quantile(self, q):
+        if self.count == 0:
+            return math.nan
+        return float(np.quantile(self.reservoir[:min(self.count, self.size)], q))
+
+
+class StreamingHistogram:
+
+    def __init__(self, bins: int = 32):
+        """
+            Histogram with a fixed amount of equal-width bins whose range grows as
+            values arrive: when a value falls outside the range, the bin width is
+            doubled, merging pairs of bins, until it fits. bins must be even.
+        """
+        if bins < 2 or bins % 2 != 0:
+            raise Exception('the amount of histogram bins must be even')
+        self.bins = bins
+        self.counts = np.zeros(bins, dtype=np.int64)
+        self.start = None
+        self.width = None
+
+    def add(self, value: float):
+        if self.start is None:
+            self.start, self.width = value, 0.0
+        if self.width == 0.0:
+            if value == self.start:
+                self.counts[0] += 1
+                return
+            # second distinct value: now we know a scale for the bins.
+            self.width = abs(value - self.start) / (self.bins - 1)
+            self.start = min(self.start, value)
+            if value == self.start:  # the old values are now on the last bin
+                self.counts[-1], self.counts[0] = self.counts[0], 0
+
+        while value < self.start:
+            self.__grow(to_left=True)
+        while value >= self.start + self.width * self.bins:
+            self.__grow(to_left=False)
+
+        self.counts[min(int((value - self.start) / self.width), self.bins - 1)] += 1
+
+    def edges(self):
+        if not self.width:
+            return [] if self.start is None else [self.start, self.start]
+        return list(self.start + self.width * np.arange(self.bins + 1))
+
+    def __grow(self, to_left: bool):
+        merged = self.counts.reshape(-1, 2).sum(axis=1)
+        half = self.bins // 2
+        self.counts = np.zeros(self.bins, dtype=np.int64)
+        if to_left:
+            self.counts[half:] = merged
+            self.start -= self.width * self.bins
+        else:
+            self.counts[:half] = merged
+        self.width *= 2
+
+
+class RunningStatistics:
+    ''' count, mean and variance (Welford), extremes, quantiles and histogram of a stream of values. '''
+
+    def __init__(self, sketch_size: int = 1024, histogram_bins: int = 32):
+        self.count = 0
+        self.nans = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.sketch = QuantileSketch(sketch_size)
+        self.histogram = StreamingHistogram(histogram_bins)
+
+    def add(self, value: float):
+        value = float(value)
+        if math.isnan(value) or math.isinf(value):
+            self.nans += 1
+            return
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        self.sketch.add(value)
+        self.histogram.add(value)
+
+    @property
+    def variance(self):
+        return self.m2 / self.count if self.count > 0 else math.nan
+
+    def summary(self) -> dict:
+        return {
+            'count': self.count,
+            'invalid': self.nans,
+            'mean': self.mean if self.count > 0 else math.nan,
+            'variance': self.variance,
+            'stddev': math.sqrt(self.variance) if self.count > 0 else math.nan,
+            'min': self.min if self.count > 0 else math.nan,
+            'max': self.max if self.count > 0 else math.nan,
+            'quantiles': {str(q): self.sketch.quantile(q) for q in (0.05, 0.25, 0.5, 0.75, 0.95)},
+            'histogram': {'edges': self.histogram.edges(), 'counts': self.histogram.counts.tolist()},
+        }
+
+
+class CorpusAggregator:
+
+    def __init__(self, fieldnames: List[str], **kwargs):
+        """
+            Keeps corpus-level statistics of every numeric field of the rows it receives,
+            without storing the rows. kwargs are passed to each RunningStatistics.
+            Non numeric fields (like the file name) are only counted.
+        """
+        self.fieldnames = fieldnames
+        self.rows = 0
+        self.kwargs = kwargs
+        self.fields = {}
+
+    def add(self, row: dict):
+        self.rows += 1
+        for name in self.fieldnames:
+            value = row[name]
+            if not isinstance(value, numbers.Real):
+                continue
+            if name not in self.fields:
+                self.fields[name] = RunningStatistics(**self.kwargs)
+            self.fields[name].add(value)
+
+    def summary(self) -> dict:
+        return {
+            'rows': self.rows,
+            'fields': {name: stats.summary() for name, stats in self.fields.items()},
+        }
+
+    def write_summary(self, filename: str):
+        with open(filename, 'w') as f:
+            json.dump(_nan_to_none(self.summary()), f, indent=2, allow_nan=False)
+
+
+def _nan_to_none(value):
+    ''' json has no NaN: the statistics of fields without values are written as null. '''
+    if isinstance(value, dict):
+        return {key: _nan_to_none(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_nan_to_none(item) for item in value]
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
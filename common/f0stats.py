@@ -22,15 +22,21 @@ class F0StatisticsExtractor(NoiseSuppressor):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
 
-    def generate_f0_statistics(self, y, sr) -> F0Statistics:
-        inoise, _ = self.noise_sel(y, sr)
+    def generate_f0_statistics(self, y, sr, inoise=None) -> F0Statistics:
+        if inoise is None:
+            inoise, _ = self.noise_sel(y, sr)
         isignal = np.logical_not(inoise)
         signal = y[isignal]
 
         if len(signal) == 0:
             return F0Statistics(0.0, 0.0, 0.0, 0.0, 0.0)
 
-        f0, pf0, ppf0 = librosa.pyin(signal, sr=sr,fmin=50,fmax=600)
+        parallelism = self.parallelism_for(len(signal), sr)
+        with self.memory_stage('pyin'):
+            if parallelism is not None:
+                f0 = parallelism.pyin(signal, sr, fmin=50, fmax=600)
+            else:
+                f0, pf0, ppf0 = librosa.pyin(signal, sr=sr,fmin=50,fmax=600)
         f0final= f0[~np.isnan(f0)]
         return F0Statistics(
             median=np.median(f0final),
@@ -0,0 +1,153 @@
+from typing import Tuple
+import numpy as np
+
+# relative margin around the threshold where we do not trust the float rounding of log10.
+_LOG_MARGIN = 1e-9
+
+
+def majority_filter(is_noise_pre, window_size: int) -> np.ndarray:
+    """
+        Vectorized version of NoiseSuppressor's boolean majority filter, with the exact same output.
+
+        That filter adds the raw votes to its window, but removes the *filtered* ones, so its
+        count at index i is the raw count of the padded window plus the accumulated difference
+        D(i) between the raw and the filtered values of every index before i - window_size.
+        D(i) only depends on outputs at least window_size + 1 indices behind, so whole blocks
+        of window_size + 1 outputs can be computed at once.
+    """
+    N = window_size
+    pre = np.asarray(is_noise_pre, dtype=bool)
+    L = len(pre)
+    out = np.zeros(L, dtype=bool)
+    if L == 0:
+        return out
+
+    padded = np.concatenate((np.ones(N, dtype=np.int64), pre.astype(np.int64), np.ones(N + 1, dtype=np.int64)))
+    cumulative = np.concatenate(([0], np.cumsum(padded)))
+    raw_count = cumulative[2 * N + 1:2 * N + 1 + L] - cumulative[:L]
+
+    # drift[k] = sum of (pre[j] - out[j]) for j < k
+    drift = np.zeros(L + 1, dtype=np.int64)
+    block = N + 1
+    for start in range(0, L, block):
+        end = min(start + block, L)
+        behind = np.maximum(np.arange(start, end) - N, 0)
+        out[start:end] = raw_count[start:end] + drift[behind] >= N + 1
+        drift[start + 1:end + 1] = drift[start] + np.cumsum(pre[start:end].astype(np.int64) - out[start:end])
+
+    return out
+
+
+def _approximate_energy(y2, window_size):
+    """
+        Sliding window energy with cumulative sums inside blocks of window_size samples,
+        which costs O(len) instead of the O(len * window_size) of the convolution.
+        Returns the approximation and a bound on its distance to the exact convolution.
+    """
+    L = len(y2)
+    W = window_size
+    n_blocks = -(-L // W) + 1  # one extra block of zeros, for the windows that go past the end
+    blocks = np.zeros(n_blocks * W)
+    blocks[:L] = y2
+    blocks = blocks.reshape(n_blocks, W)
+
+    prefix = np.zeros((n_blocks, W + 1))
+    np.cumsum(blocks, axis=1, out=prefix[:, 1:])
+    block_sums = prefix[:, -1]
+
+    i = np.arange(L)
+    b, offset = i // W, i % W
+    # the window [i, i + W) is the end of block b and the beginning of block b + 1
+    approximate = ((block_sums[b] - prefix[b, offset]) + prefix[b + 1, offset]) * (1.0 / W)
+    error = 64 * np.finfo(np.float64).eps * (block_sums[b] + block_sums[b + 1])
+    return approximate, error
+
+
+def _exact_energy(y2, indices, window_size):
+    """
+        The exact convolution values (as computed by NoiseSuppressor) at the given sorted
+        indices, convolving only the neighbourhood of each group of nearby indices.
+    """
+    W = window_size
+    window = np.ones(W) / float(W)
+    energy = np.empty(len(indices))
+    if len(indices) == 0:
+        return energy
+
+    breaks = np.nonzero(np.diff(indices) > W)[0] + 1
+    for group in np.split(np.arange(len(indices)), breaks):
+        first, last = indices[group[0]], indices[group[-1]]
+        segment = y2[first:min(last + W, len(y2))]
+        convolution = np.convolve(segment, window)[W - 1:]
+        energy[group] = convolution[indices[group] - first]
+    return energy
+
+
+def _to_db(energy):
+    edB = np.full(len(energy), -np.inf)
+    np.log10(energy, out=edB, where=energy > 0)
+    return 10 * edB
+
+
+def crop_bounds(y, sr, noise_threshold_db, noise_threshold_pct, bool_filter_window_size, window_size=4096) -> Tuple[int, int]:
+    """
+        Returns (first, last) such that y[first:last] is exactly what
+        NoiseSuppressor.just_crop_ends returns, without the full convolution.
+
+        A cheap pass approximates the energy of every window with a known error bound. The exact
+        energy is only computed where the approximation cannot decide: the candidates for the
+        minimum and maximum energies, and the windows too close to the noise threshold.
+        Windows of digital silence are at the noise floor, and an audio without any energy
+        is all noise, as in NoiseSuppressor.
+    """
+    y2 = np.power(y, 2)
+    L = len(y2)
+    imin = int(0.5 * sr)
+
+    approximate, error = _approximate_energy(y2, window_size)
+    low, high = approximate - error, approximate + error
+
+    # minimum and maximum energies, ignoring the initial and ending 0.5s
+    inner_low, inner_high = low[imin:L - imin], high[imin:L - imin]
+    positive = inner_low > 0
+    if not np.any(positive):
+        positive = np.ones(len(inner_low), dtype=bool)
+    floor = np.min(inner_high[positive])
+    ceiling = np.max(inner_low)
+    min_candidates = imin + np.nonzero(inner_low <= floor * (1 + _LOG_MARGIN))[0]
+    max_candidates = imin + np.nonzero(inner_high >= ceiling * (1 - _LOG_MARGIN))[0]
+
+    candidates = np.union1d(min_candidates, max_candidates)
+    candidates_dB = _to_db(_exact_energy(y2, candidates, window_size))
+    finite = np.isfinite(candidates_dB)
+    if not np.any(finite):
+        # no energy at all: everything is noise, so there is no signal to crop to.
+        return _signal_bounds(np.ones(L, dtype=bool))
+    in_min = np.isin(candidates, min_candidates) & finite
+    in_max = np.isin(candidates, max_candidates) & finite
+    edBmin = np.min(candidates_dB[in_min]) if np.any(in_min) else np.min(candidates_dB[finite])
+    edBmax = np.max(candidates_dB[in_max]) if np.any(in_max) else np.max(candidates_dB[finite])
+
+    noise_threshold = noise_threshold_db
+    if noise_threshold is None:
+        noise_threshold = noise_threshold_pct * (edBmax - edBmin)
+    threshold_dB = edBmin + noise_threshold
+
+    # is_noise_pre = max(edB, edBmin) < threshold_dB
+    if edBmin >= threshold_dB:
+        is_noise_pre = np.zeros(L, dtype=bool)
+    else:
+        threshold = 10 ** (threshold_dB / 10)
+        is_noise_pre = high < threshold * (1 - _LOG_MARGIN)
+        undecided = np.nonzero(~is_noise_pre & (low <= threshold * (1 + _LOG_MARGIN)))[0]
+        exact_dB = _to_db(_exact_energy(y2, undecided, window_size))
+        is_noise_pre[undecided] = np.maximum(exact_dB, edBmin) < threshold_dB
+
+    window = bool_filter_window_size or 0.2 * sr
+    return _signal_bounds(majority_filter(is_noise_pre, int(window)))
+
+
+def _signal_bounds(is_noise) -> Tuple[int, int]:
+    ''' the first and last signal samples, with the IndexError of just_crop_ends when there is none. '''
+    isignal = np.nonzero(~is_noise)[0]
+    return isignal[0], isignal[-1]
@@ -0,0 +1,187 @@
+import math
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import cpu_count
+import numpy as np
+import librosa
+
+from .noisereduce import noise_statistics, smoothed_mask, mask_signal, _smoothing_filter
+
+
+class _AudioHistory:
+    ''' total duration and amount of the audios observed by this process. '''
+
+    def __init__(self):
+        self.total_seconds = 0.0
+        self.files = 0
+        self.current_seconds = None
+        self.lock = threading.Lock()
+
+
+# the IntraFileParallelism is pickled with every job sent to a worker process, so its
+# own attributes would start over on each file: what was observed is kept per process.
+_history = _AudioHistory()
+
+
+class IntraFileParallelism:
+
+    def __init__(self, workers: int = None, chunk_seconds: float = 30.0, long_factor: float = 4.0, min_seconds: float = 600.0, min_files: int = 5):
+        """
+            Splits the work on a single long audio in overlapping time chunks, processed on
+            a thread pool and stitched back together. The heavy parts (convolutions, FFTs and
+            the array operations of pyin) release the GIL, so threads use several cores
+            without copying the audio to other processes.
+
+            An audio is split when it is at least min_seconds long and long_factor times
+            longer than the average audio previously given to observe in this process, that is,
+            when it would keep one worker busy long after the others are done. Until min_files
+            audios were observed, min_seconds alone decides.
+
+            workers (cpu_count()):
+                most threads used on a long audio. Only the cores left idle by the other
+                processes (by the load average) are used, and the audio is not split if
+                there is less than two of them, so the worker processes of a batch run
+                are not oversubscribed.
+
+            chunk_seconds (30.0):
+                length of each chunk, not counting its overlaps.
+        """
+        self.workers = workers or cpu_count()
+        self.chunk_seconds = chunk_seconds
+        self.long_factor = long_factor
+        self.min_seconds = min_seconds
+        self.min_files = min_files
+
+    def observe(self, n_samples: int, sr: int):
+        ''' tells that a new audio started being processed, for the average used by should_split. '''
+        with _history.lock:
+            if _history.current_seconds is not None:
+                _history.total_seconds += _history.current_seconds
+                _history.files += 1
+            _history.current_seconds = n_samples / sr
+
+    def should_split(self, n_samples: int, sr: int) -> bool:
+        seconds = n_samples / sr
+        if seconds < self.min_seconds or self.available_workers() < 2:
+            return False
+        with _history.lock:
+            if _history.files < self.min_files:
+                return True
+            return seconds >= self.long_factor * _history.total_seconds / _history.files
+
+    def available_workers(self) -> int:
+        ''' workers, limited to the cores that are idle, plus the one of this process. '''
+        try:
+            load = os.getloadavg()[0]
+        except OSError:
+            return self.workers
+        return max(1, min(self.workers, int(cpu_count() - load) + 1))
+
+    def map(self, f, *iterables) -> list:
+        with ThreadPoolExecutor(max_workers=self.available_workers()) as executor:
+            return list(executor.map(f, *iterables))
+
+    def sliding_convolution(self, y2, window, sr) -> np.ndarray:
+        """
+            np.convolve(y2, window)[len(window) - 1:], computed by chunks.
+            Each output only depends on the next len(window) samples, so every chunk
+            is extended by that and the result is exactly the same.
+        """
+        W = len(window)
+        L = len(y2)
+        bounds = _chunk_bounds(L, max(self.chunk_samples(sr), W))
+
+        def convolve(bound):
+            start, end = bound
+            return np.convolve(y2[start:min(end + W - 1, L)], window)[W - 1:W - 1 + end - start]
+
+        return np.concatenate(self.map(convolve, bounds))
+
+    def chunk_samples(self, sr: int) -> int:
+        return int(self.chunk_seconds * sr)
+
+    def reduce_noise(self, audio_clip, noise_clip, sr, n_grad_freq=4, n_grad_time=8, n_fft=2048, win_length=2048,
+                     hop_length=512, n_std_thresh=1.5, prop_decrease=1.0):
+        """
+            Same as noisereduce.reduce_noise (with pad_clipping and without tensorflow), computed
+            by chunks of STFT frames. Each chunk takes the frames around it that the mask
+            smoothing and the overlap-add need, and only keeps the samples that all of its
+            frames cover. The dB floor (top_db) is taken from the whole spectrogram, as in
+            the original, so the only differences are rounding in the mask smoothing.
+        """
+        _, mean_freq_noise, std_freq_noise = noise_statistics(noise_clip, n_fft, hop_length, win_length)
+        noise_thresh = mean_freq_noise + std_freq_noise * n_std_thresh
+        smoothing_filter = _smoothing_filter(n_grad_freq, n_grad_time)
+
+        nsamp = len(audio_clip)
+        audio = np.pad(audio_clip, [0, hop_length], mode='constant')
+        n_frames = 1 + len(audio) // hop_length
+        half = n_fft // 2
+        # frames whose overlap-add reaches the kept samples, and frames the smoothing reaches from those
+        istft_halo = math.ceil(half / hop_length) + 1
+        mask_halo = n_grad_time + 1
+
+        chunk_frames = max(self.chunk_samples(sr) // hop_length, 1)
+        bounds = _chunk_bounds(n_frames, chunk_frames)
+
+        def spectrogram(bound):
+            start, end = bound
+            first, last = max(start - istft_halo - mask_halo, 0), min(end + istft_halo + mask_halo, n_frames)
+            # the samples of frames [first, last) of a centered STFT, with the zeros of the centering
+            lo, hi = first * hop_length - half, (last - 1) * hop_length + n_fft - half
+            segment = np.zeros(hi - lo, dtype=audio.dtype)
+            segment[max(-lo, 0):min(hi, len(audio)) - lo] = audio[max(lo, 0):min(hi, len(audio))]
+            stft = librosa.stft(y=segment, n_fft=n_fft, hop_length=hop_length, win_length=win_length, center=False)
+            stft_db = librosa.amplitude_to_db(np.abs(stft), ref=1.0, amin=1e-20, top_db=None)
+            return stft, stft_db
+
+        spectrograms = self.map(spectrogram, bounds)
+        floor_db = max(np.max(stft_db) for _, stft_db in spectrograms) - 80.0
+
+        def recover(bound, spectrogram):
+            start, end = bound
+            stft, stft_db = spectrogram
+            first = max(start - istft_halo - mask_halo, 0)
+            mask = smoothed_mask(np.maximum(stft_db, floor_db), noise_thresh, smoothing_filter) * prop_decrease
+
+            frames_first, frames_last = max(start - istft_halo, 0), min(end + istft_halo, n_frames)
+            stft = stft[:, frames_first - first:frames_last - first]
+            mask = mask[:, frames_first - first:frames_last - first]
+            kept = slice((start - frames_first) * hop_length, (end - frames_first) * hop_length)
+            signal = librosa.istft(mask_signal(stft, mask), hop_length=hop_length, win_length=win_length)
+            noise = librosa.istft(mask_signal(stft, 1 - mask), hop_length=hop_length, win_length=win_length)
+            return signal[kept], noise[kept]
+
+        recovered = self.map(recover, bounds, spectrograms)
+        recovered_signal = np.concatenate([signal for signal, _ in recovered])[:nsamp]
+        recovered_noise = np.concatenate([noise for _, noise in recovered])[:nsamp]
+        return recovered_signal, recovered_noise
+
+    def pyin(self, y, sr, fmin, fmax, frame_length=2048, overlap_seconds=2.0) -> np.ndarray:
+        """
+            f0 of librosa.pyin, computed by chunks of frames. Each chunk is decoded with
+            overlap_seconds of audio on both sides, which are thrown away, so the Viterbi
+            decoding has settled at the kept frames. Returns only f0.
+        """
+        hop_length = frame_length // 4
+        n_frames = 1 + len(y) // hop_length
+        overlap = int(overlap_seconds * sr) // hop_length + frame_length // hop_length
+        bounds = _chunk_bounds(n_frames, max(self.chunk_samples(sr) // hop_length, overlap))
+
+        def pyin(bound):
+            start, end = bound
+            first = max(start - overlap, 0)
+            segment = y[first * hop_length:min((end + overlap) * hop_length, len(y))]
+            f0, _, _ = librosa.pyin(segment, sr=sr, fmin=fmin, fmax=fmax, frame_length=frame_length)
+            return f0[start - first:end - first]
+
+        return np.concatenate(self.map(pyin, bounds))
+
+
+def _chunk_bounds(length: int, chunk: int) -> list:
+    ''' [(start, end), ...] covering range(length). A remainder shorter than half a chunk joins the last chunk. '''
+    starts = list(range(0, length, chunk))
+    if len(starts) > 1 and length - starts[-1] < chunk // 2:
+        starts.pop()
+    return [(start, end) for start, end in zip(starts, starts[1:] + [length])]
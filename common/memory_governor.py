@@ -0,0 +1,131 @@
+import os
+import tempfile
+import threading
+import tracemalloc
+from concurrent.futures import Future
+from typing import Dict
+import numpy as np
+import soundfile as sf
+import librosa
+
+from .noise_suppressor import NoiseSuppressor
+from .f0stats import F0StatisticsExtractor
+
+# every file is decoded and resampled to this rate before processing.
+PROCESSING_RATE = 44100
+
+_SIZE_SUFFIXES = {'k': 1 << 10, 'm': 1 << 20, 'g': 1 << 30, 't': 1 << 40}
+
+
+def parse_size(size: str) -> int:
+    '''
+    parses a size in bytes, like "512M" or "8G".
+    '''
+    size = size.strip().lower().rstrip('b')
+    if size and size[-1] in _SIZE_SUFFIXES:
+        return int(float(size[:-1]) * _SIZE_SUFFIXES[size[-1]])
+    return int(size)
+
+
+def measure_stages(noise_suppressor: NoiseSuppressor, include_f0: bool = False, seconds: float = 5.0) -> Dict[str, float]:
+    """
+        Runs the processing stages over a synthetic recording, measuring with tracemalloc
+        the peak of memory allocated during each stage. Memory still held from previous stages
+        counts, since it is alive while the stage runs.
+        Returns the peak bytes per processed sample of each stage.
+    """
+    rng = np.random.default_rng(0)
+    t = np.arange(int(seconds * PROCESSING_RATE)) / PROCESSING_RATE
+    y = 0.01 * rng.standard_normal(len(t))
+    # one second of a tone every two seconds, so there is both signal and noise.
+    y += 0.5 * np.sin(2 * np.pi * 200 * t) * (np.floor(t) % 2 == 1)
+
+    handle, filename = tempfile.mkstemp(suffix='.wav')
+    os.close(handle)
+    sf.write(filename, y.astype(np.float32), PROCESSING_RATE)
+    del y, t
+    # the first load pays for imports and caches, which are not per file.
+    librosa.load(filename, sr=PROCESSING_RATE, duration=0.1)
+
+    stages = {}
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start()
+
+    def measure(stage, f, *args):
+        tracemalloc.reset_peak()
+        result = f(*args)
+        _, peak = tracemalloc.get_traced_memory()
+        stages[stage] = max(peak - base, 0) / n_samples
+        return result
+
+    try:
+        n_samples = int(seconds * PROCESSING_RATE)
+        base, _ = tracemalloc.get_traced_memory()
+        y, sr = measure('load', lambda: librosa.load(filename, sr=PROCESSING_RATE))
+        y = y - np.mean(y)
+        measure('noise_sel', noise_suppressor.noise_sel, y, sr)
+        if noise_suppressor.noise_suppress:
+            measure('reduce_noise', noise_suppressor.noise_reduce_signal, y, sr)
+        else:
+            measure('crop', noise_suppressor.just_crop_ends, y, sr)
+        if include_f0:
+            extractor = F0StatisticsExtractor(**noise_suppressor.__dict__)
+            measure('pyin', extractor.generate_f0_statistics, y, sr)
+    finally:
+        if not was_tracing:
+            tracemalloc.stop()
+        os.remove(filename)
+
+    return stages
+
+
+class MemoryGovernor:
+
+    def __init__(self, budget_bytes: int, bytes_per_sample: float, base_bytes: int = 64 << 20):
+        """
+            Admits jobs only while the sum of their estimated peak memory fits in budget_bytes.
+            The estimate of a job is base_bytes + bytes_per_sample * samples, where samples
+            comes from the duration in the file header at the processing rate.
+
+            A job bigger than the whole budget is still admitted, but only when nothing
+            else is running. Use MemoryGovernor.calibrated to measure bytes_per_sample.
+        """
+        self.budget_bytes = budget_bytes
+        self.bytes_per_sample = bytes_per_sample
+        self.base_bytes = base_bytes
+        self.in_use = 0
+        self.admitted = 0
+        self.condition = threading.Condition()
+
+    @staticmethod
+    def calibrated(budget_bytes: int, noise_suppressor: NoiseSuppressor, include_f0: bool = False, **kwargs):
+        '''
+        creates a governor whose factor is the biggest per stage factor measured by measure_stages.
+        '''
+        stages = measure_stages(noise_suppressor, include_f0)
+        return MemoryGovernor(budget_bytes, max(stages.values()), **kwargs)
+
+    def estimate(self, source_path, duration: float = None) -> int:
+        if duration is None:
+            try:
+                duration = sf.info(str(source_path)).duration
+            except Exception:
+                # we cannot read the header: let the job run alone
+                return self.budget_bytes
+        return int(self.base_bytes + self.bytes_per_sample * duration * PROCESSING_RATE)
+
+    def acquire(self, cost: int):
+        ''' blocks until there is memory for a job of this cost. '''
+        with self.condition:
+            while self.admitted > 0 and self.in_use + cost > self.budget_bytes:
+                self.condition.wait()
+            self.in_use += cost
+            self.admitted += 1
+
+    def release(self, cost: int, _future: Future = None):
+        ''' gives back the memory of a job. Can be used as a future's done callback. '''
+        with self.condition:
+            self.in_use -= cost
+            self.admitted -= 1
+            self.condition.notify_all()
@@ -0,0 +1,242 @@
+import json
+import os
+import threading
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List
+import numpy as np
+
+
+def current_rss() -> int:
+    ''' resident memory of this process in bytes, or None where /proc is not available. '''
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+
+@dataclass
+class _Stage:
+    name: str
+    traced_base: int
+    traced_peak: int = 0
+    rss_base: int = None
+    rss_peak: int = None
+
+    def sample_rss(self, rss):
+        if rss is not None and (self.rss_peak is None or rss > self.rss_peak):
+            self.rss_peak = rss
+
+
+@dataclass
+class _FileRecord:
+    file: str
+    duration: float = None
+    stages: Dict[str, dict] = field(default_factory=dict)
+    open_stages: List[_Stage] = field(default_factory=list)
+    rss_peak: int = None
+    error: str = None
+
+    def sample_rss(self, rss):
+        if rss is not None and (self.rss_peak is None or rss > self.rss_peak):
+            self.rss_peak = rss
+        for stage in self.open_stages:
+            stage.sample_rss(rss)
+
+    def to_json(self) -> str:
+        return json.dumps({
+            'file': self.file,
+            'duration': self.duration,
+            'pid': os.getpid(),
+            'rss_peak_bytes': self.rss_peak,
+            'error': self.error,
+            'stages': self.stages,
+        })
+
+
+class MemoryProfiler:
+
+    def __init__(self, records_file: str, rss_interval: float = 0.01):
+        """
+            Opt-in memory instrumentation of the processing of each file, for the NoiseSuppressor
+            option memory_profiler. Each stage of the processing (load, sliding_window_energy, stft,
+            reduce_noise, pyin, ...) records the peak of memory allocated during it with tracemalloc,
+            above what was allocated when it started, and the peak resident memory, sampled every
+            rss_interval seconds, above the resident memory when it started. tracemalloc sees the
+            arrays of numpy, but not every buffer of the native libraries, which RSS does.
+
+            One json line per file is appended to records_file, from whatever process handled it,
+            with the peaks of each stage (the biggest, if it ran more than once). memory_report
+            turns them into bytes per audio second by stage (see cli/memory_report.py).
+
+            tracemalloc is process wide, so the measures are only meaningful when each process
+            handles one file at a time, as in the process pools. It is only on during the stages,
+            since it makes the allocations of python objects much slower.
+        """
+        self.records_file = records_file
+        self.rss_interval = rss_interval
+        self.__init_local()
+
+    def __init_local(self):
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['local'], state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__init_local()
+
+    @contextmanager
+    def file(self, filename):
+        ''' records the stages run inside it, by this thread, as the ones of filename. '''
+        record = _FileRecord(str(filename))
+        self.local.record = record
+        record.sample_rss(current_rss())
+
+        done = threading.Event()
+        def sample():
+            while not done.wait(self.rss_interval):
+                record.sample_rss(current_rss())
+        sampler = threading.Thread(target=sample, daemon=True)
+        sampler.start()
+
+        try:
+            yield record
+        except BaseException as e:
+            record.error = str(e)
+            raise
+        finally:
+            done.set()
+            sampler.join()
+            self.local.record = None
+            with self.lock:
+                with open(self.records_file, 'a') as f:
+                    f.write(record.to_json() + '\n')
+
+    def observe(self, n_samples: int, sr: int):
+        ''' the duration of the file being recorded, once it is decoded. '''
+        record = getattr(self.local, 'record', None)
+        if record is not None:
+            record.duration = n_samples / sr
+
+    @contextmanager
+    def stage(self, name: str):
+        '''
+        measures a stage of the file being recorded. Stages can be nested: the peaks of
+        the inner ones also count for the outer ones. Outside of file, it does nothing.
+        '''
+        record = getattr(self.local, 'record', None)
+        if record is None:
+            yield
+            return
+
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        # reset_peak forgets the peak of the enclosing stage, so it is kept first.
+        current, peak = tracemalloc.get_traced_memory()
+        if record.open_stages:
+            parent = record.open_stages[-1]
+            parent.traced_peak = max(parent.traced_peak, peak)
+        tracemalloc.reset_peak()
+        rss = current_rss()
+        stage = _Stage(name, current, current, rss, rss)
+        record.open_stages.append(stage)
+        try:
+            yield
+        finally:
+            _, peak = tracemalloc.get_traced_memory()
+            stage.traced_peak = max(stage.traced_peak, peak)
+            if started:
+                tracemalloc.stop()
+            record.sample_rss(current_rss())
+            record.open_stages.pop()
+            if record.open_stages:
+                parent = record.open_stages[-1]
+                parent.traced_peak = max(parent.traced_peak, stage.traced_peak)
+
+            previous = record.stages.get(name, {'calls': 0, 'traced_peak_bytes': 0, 'rss_peak_bytes': None})
+            rss_peak = None if stage.rss_base is None else stage.rss_peak - stage.rss_base
+            record.stages[name] = {
+                'calls': previous['calls'] + 1,
+                'traced_peak_bytes': max(previous['traced_peak_bytes'], stage.traced_peak - stage.traced_base),
+                'rss_peak_bytes': rss_peak if previous['rss_peak_bytes'] is None else max(previous['rss_peak_bytes'], rss_peak or 0),
+            }
+
+
+def memory_stage(profiler: MemoryProfiler, name: str):
+    ''' profiler.stage(name), or a context that does nothing if there is no profiler. '''
+    return nullcontext() if profiler is None else profiler.stage(name)
+
+
+def read_records(filenames: Iterable[str]) -> List[dict]:
+    records = []
+    for filename in filenames:
+        with open(filename) as f:
+            records.extend(json.loads(line) for line in f if line.strip())
+    return records
+
+
+def memory_report(records: List[dict], min_duration: float = 1.0, skip_first: bool = True) -> Dict[str, dict]:
+    """
+        Bytes per audio second of each stage over the records of MemoryProfiler: the median,
+        95th percentile and maximum over the files of the allocated peak, and the median and
+        maximum of the resident peak. Files that failed or whose duration is unknown are left out.
+
+        A stage also allocates a fixed amount per file, which would dominate the bytes per second
+        of short files, so files up to min_duration seconds are left out too. With skip_first, so
+        is the first file of each process, whose stages also allocate what the process keeps
+        for the next files (imports, caches, the first resident pages).
+    """
+    per_stage = {}
+    seen_pids = set()
+    for record in records:
+        first = record['pid'] not in seen_pids
+        seen_pids.add(record['pid'])
+        if skip_first and first:
+            continue
+        if record['error'] is not None or not record['duration'] or record['duration'] <= min_duration:
+            continue
+        for name, stage in record['stages'].items():
+            traced, rss = per_stage.setdefault(name, ([], []))
+            traced.append(stage['traced_peak_bytes'] / record['duration'])
+            if stage['rss_peak_bytes'] is not None:
+                rss.append(stage['rss_peak_bytes'] / record['duration'])
+
+    report = {}
+    for name, (traced, rss) in sorted(per_stage.items()):
+        report[name] = {
+            'files': len(traced),
+            'traced_median': float(np.median(traced)),
+            'traced_p95': float(np.percentile(traced, 95)),
+            'traced_max': float(np.max(traced)),
+            'rss_median': float(np.median(rss)) if rss else None,
+            'rss_max': float(np.max(rss)) if rss else None,
+        }
+    return report
+
+
+def memory_regressions(report: Dict[str, dict], baseline: Dict[str, dict], max_growth: float = 0.2,
+                       metrics: Iterable[str] = ('traced_median', 'traced_p95')) -> List[str]:
+    '''
+    compares a memory_report with a previous one. Returns a problem for each metric of
+    a stage that grew more than max_growth (0.2 = 20%), empty if there is none.
+    '''
+    problems = []
+    for name, stage in report.items():
+        if name not in baseline:
+            continue
+        for metric in metrics:
+            before, after = baseline[name].get(metric), stage.get(metric)
+            if before is None or after is None:
+                continue
+            if after > before * (1 + max_growth):
+                growth = after / before - 1 if before > 0 else float('inf')
+                problems.append(f'{name}: {metric} grew {growth:.0%}, from {before:.0f} to {after:.0f} bytes per audio second')
+    return problems
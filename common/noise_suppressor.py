@@ -1,8 +1,12 @@
 import numpy as np
 import soundfile as sf
 import librosa
+from contextlib import nullcontext
 
-from .noisereduce import reduce_noise
+from .noisereduce import reduce_noise, signal_spectrogram
+from .fast_crop import crop_bounds
+from .intra_file import IntraFileParallelism
+from .memory_profile import memory_stage
 from .textgrid_writer import audio_to_textgrid, write_textgrid_to_file
 
 
@@ -15,7 +19,11 @@ class NoiseSuppressor:
         'std_threshold': 1.5,
         'suppresion_pct': 1.0,
         'noise_suppress': True,
-        'generate_textgrid': False
+        'generate_textgrid': False,
+        'fast_crop': False,
+        'intra_file_parallelism': False,
+        'spectral_energy': False,
+        'memory_profiler': None
     }
     
     def __init__(self, **kwargs):
@@ -60,8 +68,37 @@ class NoiseSuppressor:
 
             generate_textgrid (False):
                 Generate a Praat textgrid containing sections where we detected we have signal/noise.
+
+            fast_crop (False):
+                When only cutting the ends (noise_suppress=False), avoid the full sliding window
+                convolution and the per sample majority filter. The cut is exactly the same,
+                but long audios are cropped many times faster. See common/fast_crop.py.
+
+            intra_file_parallelism (False):
+                Split the energy, the noise reduction and the f0 extraction of audios much longer
+                than the average audio in overlapping chunks, processed on a thread pool, using
+                the cores the other processes leave idle.
+                True uses the default IntraFileParallelism, False disables it, and an
+                IntraFileParallelism instance configures it. See common/intra_file.py.
+                It is not enabled by default: its threads compete for the cores with the worker
+                processes of a batch run, so it only pays off on corpora with a few audios much
+                longer than the rest, and its noise reduction differs from the one of the whole
+                audio by rounding (around 1e-16), so runs with and without it are not bit-exact.
+
+            spectral_energy (False):
+                With noise_suppress, take the energy used to find the noise from the spectrogram
+                the noise reduction computes anyway, instead of a sliding window convolution, so
+                both share one transform. The energy only changes every 512 samples, so the
+                segmentation may differ by a few milliseconds; see cli/compare_segmentation.py.
+                Audios split by intra_file_parallelism still use the convolution.
+
+            memory_profiler (None):
+                A MemoryProfiler that records the memory allocated by each stage of the
+                processing of each file. See common/memory_profile.py.
         """
         self.__dict__ = { **self.__DEFAULTS, **kwargs }
+        if self.intra_file_parallelism is True:
+            self.intra_file_parallelism = IntraFileParallelism()
 
     def noise_reduce_signal(self, y, sr):
         # We can only work with audios longer than 1 second, because
@@ -69,16 +106,33 @@ class NoiseSuppressor:
         if len(y) <= sr * 1:
             return y, np.zeros(len(y))
 
-        inoise, _ = self.noise_sel(y, sr)
+        parallelism = self.parallelism_for(len(y), sr)
+        spectrogram = None
+        if self.spectral_energy and parallelism is None:
+            # same parameters as the defaults of reduce_noise
+            with self.memory_stage('stft'):
+                spectrogram = signal_spectrogram(y, n_fft=2048, hop_length=512, win_length=2048)
+            inoise, _ = self.noise_sel(y, sr, energy=self.spectral_noise_energy(y, sr, spectrogram[0]))
+        else:
+            inoise, _ = self.noise_sel(y, sr)
         noise = y[inoise]
 
-        reduced_y, ε = reduce_noise(audio_clip=y,
-                                    noise_clip=noise,
-                                    n_grad_freq=4,
-                                    n_grad_time=8,
-                                    n_std_thresh=self.std_threshold,
-                                    prop_decrease=self.suppresion_pct,
-                                    verbose=False)
+        with self.memory_stage('reduce_noise'):
+            if parallelism is not None:
+                reduced_y, ε = parallelism.reduce_noise(y, noise, sr,
+                                                        n_grad_freq=4,
+                                                        n_grad_time=8,
+                                                        n_std_thresh=self.std_threshold,
+                                                        prop_decrease=self.suppresion_pct)
+            else:
+                reduced_y, ε = reduce_noise(audio_clip=y,
+                                            noise_clip=noise,
+                                            n_grad_freq=4,
+                                            n_grad_time=8,
+                                            n_std_thresh=self.std_threshold,
+                                            prop_decrease=self.suppresion_pct,
+                                            verbose=False,
+                                            sig_spectrogram=spectrogram)
 
         reduced_y = self.__cut_noise_from_edges(reduced_y, inoise)
 
@@ -88,15 +142,38 @@ class NoiseSuppressor:
 
         return reduced_y, ε
 
-    def just_crop_ends(self, y, sr):
+    def just_crop_ends(self, y, sr, is_noise=None):
+        """
+            Cuts the preliminary noise from the beginning and ending of y.
+            is_noise can be given if noise_sel(y, sr) was already computed.
+        """
         if len(y) <= sr * 1:
             return y
 
+        if is_noise is not None:
+            return self.__cut_noise_from_edges(y, is_noise)
+
+        if self.fast_crop:
+            with self.memory_stage('fast_crop'):
+                first_signal, last_signal = crop_bounds(y, sr, self.noise_threshold_db, self.noise_threshold_pct,
+                                                        self.bool_filter_window_size)
+            return y[first_signal:last_signal]
+
         inoise, _ = self.noise_sel(y, sr)
         return self.__cut_noise_from_edges(y, inoise)
 
     def process_signal_file(self, filename, save_to):
-        y, sr = librosa.load(filename, sr=44100)
+        with self.profile_file(filename):
+            with self.memory_stage('load'):
+                y, sr = librosa.load(filename, sr=44100)
+            self.observe_audio(y, sr)
+            self.process_signal(y, sr, save_to)
+        return filename
+
+    def process_signal(self, y, sr, save_to):
+        """
+            Processes an already decoded audio like process_signal_file, saving it to save_to.
+        """
         y = self.__remove_dc(y)
         if self.noise_suppress:
             reduced_y, _ = self.noise_reduce_signal(y, sr)
@@ -110,7 +187,6 @@ class NoiseSuppressor:
             write_textgrid_to_file(f'{save_to}.TextGrid', save_to, tg)
 
         sf.write(save_to, reduced_y, sr)
-        return filename
 
     def __remove_dc(self, y):
         """
@@ -126,22 +202,69 @@ class NoiseSuppressor:
         y2 = np.power(y, 2)
         window = np.ones(window_size) / float(window_size)
 
-        # decibel calculation.
-        # Some borders of the convolution may have zeroes on them, and that
-        # makes taking log10 especially hard. We'll ignore them and leave them zero.
-        convolution = np.convolve(y2, window)
-        edB = 10 * np.log10(convolution, where=convolution > 0)[window_size - 1:]
+        parallelism = self.parallelism_for(len(y), sr)
+        if parallelism is not None:
+            convolution = parallelism.sliding_convolution(y2, window, sr)
+        else:
+            convolution = np.convolve(y2, window)[window_size - 1:]
+
+        return self.__energy_range(self.__to_dB(convolution), sr)
 
+    def __to_dB(self, energy):
+        """
+            10 * log10(energy), with -inf for the windows without energy (digital silence
+            and the borders of the convolution), instead of taking log10 of zero.
+        """
+        edB = np.full(len(energy), -np.inf)
+        np.log10(energy, out=edB, where=energy > 0)
+        return 10 * edB
+
+    def __energy_range(self, edB, sr):
+        """
+            The minimum and maximum energies edBmin and edBmax, and edB raised to edBmin.
+            Windows without energy are at the noise floor, like in the StreamingSegmenter:
+            they do not count for the minimum, and are raised to it. An audio without any
+            energy has no floor, and is all noise.
+        """
         # we throw away the initial and ending 0.5s, because the sliding windows
         # are not correct in the initial/final borders.
         imin = int(0.5 * sr)
+        inner = edB[imin:len(edB) - imin]
+        inner = inner[np.isfinite(inner)]
+        if len(inner) == 0:
+            return np.full(len(edB), -np.inf), 0.0, 0.0
 
-        edBmin = np.min(edB[imin:-imin])
-        edBmax = np.max(edB[imin:-imin])
+        edBmin = np.min(inner)
+        edBmax = np.max(inner)
         edB = np.maximum(edB, edBmin)
 
         return edB, edBmin, edBmax
 
+    def __spectral_window_energy(self, sig_stft, n_samples, sr, window_size=4096, hop_length=512):
+        """
+            Same as __sliding_window_energy, but from the STFT of the signal, with hann windows
+            centered every hop_length samples. By Parseval, each frame gives the energy of its
+            windowed samples, and the squared hann windows at a hop of a quarter of their
+            length add up to 1.5, so the frames centered in a window of window_size samples
+            add up to about 1.5 times its energy. The window starting at sample i is taken
+            from the frames centered from i on.
+        """
+        n_fft = 2 * (sig_stft.shape[0] - 1)
+        power = np.abs(sig_stft) ** 2
+        # the bins between 0 and n_fft / 2 stand for their negative frequencies too.
+        frame_energy = (2 * power.sum(axis=0, dtype=np.float64) - power[0] - power[-1]) / n_fft
+
+        frames_per_window = window_size // hop_length
+        window_energy = np.convolve(frame_energy, np.ones(frames_per_window))[frames_per_window - 1:]
+        window_energy /= 1.5 * window_size
+        window_edB = self.__to_dB(window_energy)
+
+        # the first frame centered at or after the sample.
+        first_frame = np.minimum(-(-np.arange(n_samples) // hop_length), len(window_edB) - 1)
+        edB = window_edB[first_frame]
+
+        return self.__energy_range(edB, sr)
+
     def __boolean_majority_filter(self, y, window_size):
         """
             Applies a majority filter boolean vectors
@@ -196,8 +319,61 @@ class NoiseSuppressor:
 
         return y[first_signal:last_signal]
     
-    def noise_sel(self, y, sr, noise_threshold: float = None, eliminate_noise_bigger_than_seconds: float = 0.2):
-        edB, edBmin, edBmax = self.__sliding_window_energy(y, sr)
+    def observe_audio(self, y, sr):
+        """
+            Tells the intra-file parallelism that a new audio is being processed, so it knows
+            the average audio length. Called once per file, right after loading it.
+        """
+        if self.intra_file_parallelism:
+            self.intra_file_parallelism.observe(len(y), sr)
+        if self.memory_profiler:
+            self.memory_profiler.observe(len(y), sr)
+
+    def profile_file(self, filename):
+        """
+            Context in which the memory_profiler records the stages of filename.
+            It does nothing without a memory_profiler.
+        """
+        if self.memory_profiler:
+            return self.memory_profiler.file(filename)
+        return nullcontext()
+
+    def memory_stage(self, name):
+        """
+            Context that records the memory of a stage of the file being profiled.
+        """
+        return memory_stage(self.memory_profiler, name)
+
+    def parallelism_for(self, n_samples, sr):
+        """
+            The IntraFileParallelism that should split an audio of n_samples, or None
+            if it should be processed serially.
+        """
+        if self.intra_file_parallelism and self.intra_file_parallelism.should_split(n_samples, sr):
+            return self.intra_file_parallelism
+        return None
+
+    def noise_energy(self, y, sr):
+        """
+            The sliding window energy used by noise_sel, as (edB, edBmin, edBmax).
+            It does not depend on any parameter, so it can be computed once and
+            passed to noise_sel many times.
+        """
+        with self.memory_stage('sliding_window_energy'):
+            return self.__sliding_window_energy(y, sr)
+
+    def spectral_noise_energy(self, y, sr, sig_stft=None):
+        """
+            The energy used by noise_sel with spectral_energy, as (edB, edBmin, edBmax),
+            from sig_stft, the STFT of y given by signal_spectrogram (computed if not given).
+        """
+        if sig_stft is None:
+            sig_stft, _ = signal_spectrogram(y, n_fft=2048, hop_length=512, win_length=2048)
+        with self.memory_stage('spectral_window_energy'):
+            return self.__spectral_window_energy(sig_stft, len(y), sr)
+
+    def noise_sel(self, y, sr, noise_threshold: float = None, eliminate_noise_bigger_than_seconds: float = 0.2, energy=None):
+        edB, edBmin, edBmax = energy if energy is not None else self.noise_energy(y, sr)
 
         noise_threshold = self.noise_threshold_db
         if noise_threshold is None:
@@ -20,7 +20,7 @@ def _istft(y, n_fft, hop_length, win_length, use_tensorflow=False):
         # return librosa.istft(y, hop_length, win_length)
         return _istft_tensorflow(y.T, n_fft, hop_length, win_length)
     else:
-        return librosa.istft(y, hop_length, win_length)
+        return librosa.istft(y, hop_length=hop_length, win_length=win_length)
 
 
 def _stft_librosa(y, n_fft, hop_length, win_length):
@@ -30,7 +30,7 @@ def _stft_librosa(y, n_fft, hop_length, win_length):
 
 
 def _istft_librosa(y, hop_length, win_length):
-    return librosa.istft(y, hop_length, win_length)
+    return librosa.istft(y, hop_length=hop_length, win_length=win_length)
 
 
 def _stft_tensorflow(y, n_fft, hop_length, win_length):
@@ -166,6 +166,58 @@ def load_tensorflow(verbose=False):
     return True
 
 
+def noise_statistics(noise_clip, n_fft, hop_length, win_length, use_tensorflow=False):
+    """ Spectrogram (in dB) of a clip containing only noise, and its mean and
+    standard deviation on each frequency.
+
+    Returns:
+        noise_stft_db, mean_freq_noise, std_freq_noise
+    """
+    noise_stft = _stft(
+        noise_clip, n_fft, hop_length, win_length, use_tensorflow=use_tensorflow
+    )
+    noise_stft_db = _amp_to_db(np.abs(noise_stft))  # convert to dB
+    mean_freq_noise = np.mean(noise_stft_db, axis=1)
+    std_freq_noise = np.std(noise_stft_db, axis=1)
+    return noise_stft_db, mean_freq_noise, std_freq_noise
+
+
+def signal_spectrogram(audio_clip, n_fft, hop_length, win_length, pad_clipping=True, use_tensorflow=False):
+    """ STFT of the signal and its magnitude in dB. It does not depend on the noise,
+    so it can be reused for different noise thresholds.
+
+    Returns:
+        sig_stft, sig_stft_db
+    """
+    # pad signal with zeros to avoid extra frames being clipped if desired
+    if pad_clipping:
+        audio_clip = np.pad(audio_clip, [0, hop_length], mode="constant")
+
+    sig_stft = _stft(
+        audio_clip, n_fft, hop_length, win_length, use_tensorflow=use_tensorflow
+    )
+    # spectrogram of signal in dB
+    sig_stft_db = _amp_to_db(np.abs(sig_stft))
+    return sig_stft, sig_stft_db
+
+
+def smoothed_mask(sig_stft_db, noise_thresh, smoothing_filter, use_tensorflow=False):
+    """ Mask of the time/frequency bins of the signal below the noise threshold,
+    smoothed by the smoothing filter. It still has to be scaled by prop_decrease.
+    """
+    # calculate the threshold for each frequency/time bin
+    db_thresh = np.repeat(
+        np.reshape(noise_thresh, [1, len(noise_thresh)]),
+        np.shape(sig_stft_db)[1],
+        axis=0,
+    ).T
+    # mask if the signal is above the threshold
+    sig_mask = sig_stft_db < db_thresh
+
+    # convolve the mask with a smoothing filter
+    return convolve_gaussian(sig_mask, smoothing_filter, use_tensorflow)
+
+
 def reduce_noise(
     audio_clip,
     noise_clip,
@@ -179,6 +231,7 @@ def reduce_noise(
     pad_clipping=True,
     use_tensorflow=False,
     verbose=False,
+    sig_spectrogram=None,
 ):
     """Remove noise from audio based upon a clip containing only noise
     Args:
@@ -194,6 +247,7 @@ def reduce_noise(
         pad_clipping (bool): Pad the signals with zeros to ensure that the reconstructed data is equal length to the data
         use_tensorflow (bool): Use tensorflow as a backend for convolution and fft to speed up computation
         verbose (bool): Whether to plot the steps of the algorithm
+        sig_spectrogram (tuple): (sig_stft, sig_stft_db) of audio_clip from signal_spectrogram, if it was already computed with the same parameters
     Returns:
         array: The recovered signal with noise subtracted
     """
@@ -209,44 +263,26 @@ def reduce_noise(
 
     update_pbar(pbar, "STFT on noise")
     # STFT over noise
-    noise_stft = _stft(
+    noise_stft_db, mean_freq_noise, std_freq_noise = noise_statistics(
         noise_clip, n_fft, hop_length, win_length, use_tensorflow=use_tensorflow
     )
-    noise_stft_db = _amp_to_db(np.abs(noise_stft))  # convert to dB
     # Calculate statistics over noise
     update_pbar(pbar, "STFT on signal")
-    mean_freq_noise = np.mean(noise_stft_db, axis=1)
-    std_freq_noise = np.std(noise_stft_db, axis=1)
     noise_thresh = mean_freq_noise + std_freq_noise * n_std_thresh
     # STFT over signal
     update_pbar(pbar, "STFT on signal")
 
-    # pad signal with zeros to avoid extra frames being clipped if desired
-    if pad_clipping:
-        nsamp = len(audio_clip)
-        audio_clip = np.pad(audio_clip, [0, hop_length], mode="constant")
-
-    sig_stft = _stft(
-        audio_clip, n_fft, hop_length, win_length, use_tensorflow=use_tensorflow
-    )
-    # spectrogram of signal in dB
-    sig_stft_db = _amp_to_db(np.abs(sig_stft))
+    nsamp = len(audio_clip)
+    if sig_spectrogram is None:
+        sig_spectrogram = signal_spectrogram(
+            audio_clip, n_fft, hop_length, win_length, pad_clipping, use_tensorflow=use_tensorflow
+        )
+    sig_stft, sig_stft_db = sig_spectrogram
     update_pbar(pbar, "Generate mask")
-
-    # calculate the threshold for each frequency/time bin
-    db_thresh = np.repeat(
-        np.reshape(noise_thresh, [1, len(mean_freq_noise)]),
-        np.shape(sig_stft_db)[1],
-        axis=0,
-    ).T
-    # mask if the signal is above the threshold
-    sig_mask = sig_stft_db < db_thresh
-    update_pbar(pbar, "Smooth mask")
     # Create a smoothing filter for the mask in time and frequency
     smoothing_filter = _smoothing_filter(n_grad_freq, n_grad_time)
-
-    # convolve the mask with a smoothing filter
-    sig_mask = convolve_gaussian(sig_mask, smoothing_filter, use_tensorflow)
+    sig_mask = smoothed_mask(sig_stft_db, noise_thresh, smoothing_filter, use_tensorflow)
+    update_pbar(pbar, "Smooth mask")
 
     sig_mask = sig_mask * prop_decrease
 
@@ -269,8 +305,8 @@ def reduce_noise(
     )
     # fix the recovered signal length if padding signal
     if pad_clipping:
-        recovered_signal = librosa.util.fix_length(recovered_signal, nsamp)
-        recovered_noise = librosa.util.fix_length(recovered_noise, nsamp)
+        recovered_signal = librosa.util.fix_length(recovered_signal, size=nsamp)
+        recovered_noise = librosa.util.fix_length(recovered_noise, size=nsamp)
 
     recovered_spec = _amp_to_db(
         np.abs(
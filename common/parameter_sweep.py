@@ -0,0 +1,134 @@
+from dataclasses import dataclass
+from itertools import product
+from typing import Dict, List, Tuple
+import numpy as np
+import soundfile as sf
+import librosa
+
+from .noise_suppressor import NoiseSuppressor
+from .noisereduce import _istft, _smoothing_filter, noise_statistics, signal_spectrogram, smoothed_mask
+
+SEGMENTATION_PARAMETERS = ['noise_threshold_db', 'noise_threshold_pct', 'bool_filter_window_size']
+SWEEPABLE_PARAMETERS = SEGMENTATION_PARAMETERS + ['std_threshold', 'suppresion_pct']
+
+
+@dataclass
+class SweepResult:
+    filename: str
+    setting: int
+    noise_threshold_db: float
+    noise_threshold_pct: float
+    bool_filter_window_size: int
+    std_threshold: float
+    suppresion_pct: float
+    noise_ratio: float
+    output_seconds: float
+    output_rms: float
+
+
+class ParameterSweep:
+
+    def __init__(self, grid: Dict[str, list], n_fft=2048, win_length=2048, hop_length=512, n_grad_freq=4, n_grad_time=8):
+        """
+            Runs NoiseSuppressor.noise_reduce_signal over every combination of a parameter grid,
+            computing each intermediate result only once per file:
+
+            - the sliding window energy, the signal STFT and its inverse do not depend on any parameter;
+            - the noise selection and the noise spectrum depend only on the segmentation parameters
+              (noise_threshold_db, noise_threshold_pct, bool_filter_window_size);
+            - the smoothed mask depends on those and on std_threshold;
+            - suppresion_pct only scales the mask, and since the ISTFT is linear, every
+              suppresion_pct is a weighted sum of two signals that were already reconstructed.
+
+            grid:
+                maps each parameter to the list of values to try. Parameters that are not in the grid
+                keep NoiseSuppressor's default. Example: {'noise_threshold_pct': [0.2, 0.34], 'std_threshold': [1, 1.5, 2]}
+        """
+        unknown = set(grid) - set(SWEEPABLE_PARAMETERS)
+        if unknown:
+            raise Exception(f'cannot sweep over {", ".join(sorted(unknown))}')
+
+        defaults = NoiseSuppressor().__dict__
+        self.grid = {name: list(grid.get(name, [defaults[name]])) for name in SWEEPABLE_PARAMETERS}
+        self.settings = [dict(zip(self.grid, values)) for values in product(*self.grid.values())]
+
+        self.n_fft = n_fft
+        self.win_length = win_length
+        self.hop_length = hop_length
+        self.smoothing_filter = _smoothing_filter(n_grad_freq, n_grad_time)
+
+    def sweep_signal(self, y, sr) -> List[Tuple[dict, np.ndarray, np.ndarray]]:
+        """
+            Returns, for each setting, in the same order as self.settings,
+            a tuple (setting, reduced_y, is_noise).
+        """
+        # We can only work with audios longer than 1 second, as in noise_reduce_signal
+        if len(y) <= sr * 1:
+            return [(setting, y, np.zeros(len(y), dtype=bool)) for setting in self.settings]
+
+        energy = NoiseSuppressor().noise_energy(y, sr)
+        sig_stft, sig_stft_db = signal_spectrogram(y, self.n_fft, self.hop_length, self.win_length)
+        full_signal = self.__istft(sig_stft, len(y))
+        scale = max(max(y), -min(y), 1)
+
+        selections = {}
+        masked_signals = {}
+        results = []
+        for setting in self.settings:
+            segmentation = tuple(setting[name] for name in SEGMENTATION_PARAMETERS)
+            if segmentation not in selections:
+                suppressor = NoiseSuppressor(**dict(zip(SEGMENTATION_PARAMETERS, segmentation)))
+                is_noise, _ = suppressor.noise_sel(y, sr, energy=energy)
+                _, mean_freq_noise, std_freq_noise = noise_statistics(
+                    y[is_noise], self.n_fft, self.hop_length, self.win_length)
+                selections[segmentation] = is_noise, mean_freq_noise, std_freq_noise
+            is_noise, mean_freq_noise, std_freq_noise = selections[segmentation]
+
+            mask_key = segmentation + (setting['std_threshold'],)
+            if mask_key not in masked_signals:
+                noise_thresh = mean_freq_noise + std_freq_noise * setting['std_threshold']
+                sig_mask = smoothed_mask(sig_stft_db, noise_thresh, self.smoothing_filter)
+                masked_signals[mask_key] = self.__istft(sig_stft * sig_mask, len(y))
+
+            # istft(S * (1 - p * M)) == istft(S) - p * istft(S * M)
+            reduced_y = full_signal - setting['suppresion_pct'] * masked_signals[mask_key]
+
+            isignal, *_ = np.where(is_noise == False)
+            reduced_y = reduced_y[isignal[0]:isignal[-1]] / scale
+            results.append((setting, reduced_y, is_noise))
+
+        return results
+
+    def sweep_file(self, filename, save_to=None) -> List[SweepResult]:
+        """
+            Sweeps a file. If save_to is given, the output of each setting i is saved
+            replacing the '.cleaned.wav' (or '.wav') suffix of save_to by '.sweep<i>.wav'.
+        """
+        y, sr = librosa.load(filename, sr=44100)
+        y = y[:] - np.mean(y)
+
+        results = []
+        for i, (setting, reduced_y, is_noise) in enumerate(self.sweep_signal(y, sr)):
+            if save_to is not None:
+                sf.write(self.output_name(save_to, i), reduced_y, sr)
+            results.append(SweepResult(
+                filename=filename,
+                setting=i,
+                **setting,
+                noise_ratio=np.count_nonzero(is_noise) / len(y),
+                output_seconds=len(reduced_y) / sr,
+                output_rms=float(np.sqrt(np.mean(np.power(reduced_y, 2)))) if len(reduced_y) > 0 else 0.0,
+            ))
+        return results
+
+    @staticmethod
+    def output_name(save_to: str, setting: int) -> str:
+        for suffix in ('.cleaned.wav', '.wav'):
+            if save_to.endswith(suffix):
+                save_to = save_to[:-len(suffix)]
+                break
+        return f'{save_to}.sweep{setting}.wav'
+
+    def __istft(self, stft, nsamp):
+        # the spectrogram was computed over the signal padded with hop_length zeros.
+        return librosa.util.fix_length(_istft(stft, self.n_fft, self.hop_length, self.win_length), size=nsamp)
@@ -1,13 +1,22 @@
 from multiprocessing import cpu_count
 from os import makedirs
+from os.path import abspath
 from pathlib import Path
 from concurrent.futures import ProcessPoolExecutor, Future
 from argparse import ArgumentParser
 from functools import partial
-from typing import Callable, List
+from typing import Any, AsyncIterator, Callable, Iterator, List
+from dataclasses import dataclass
+from queue import Queue
+import asyncio
 import sys
 
 from .noise_suppressor import NoiseSuppressor
+from .sharding import Shard
+from .telemetry import Telemetry, init_worker, timed_call
+from .memory_governor import MemoryGovernor
+from .supervised_pool import SupervisedPool, Supervision
+from .corpus_index import IndexSelection
 
 def path_iterator(paths, output_path, paths_to_ignore):
     for search_path in paths:
@@ -25,11 +34,26 @@ def path_iterator(paths, output_path, paths_to_ignore):
             continue
 
         for path in Path(search_path).rglob('*'):
+            # rglob already walks the subdirectories, we only want their files.
+            if path.is_dir():
+                continue
             sub_output_path = output_path if output_path is None else f'{output_path}/{path.relative_to(search_path).parent}'
             generator = path_iterator([path], sub_output_path, paths_to_ignore)
             if generator is not None:
                 yield from generator
 
+def relative_path_iterator(paths, output_path, paths_to_ignore):
+    '''
+    same as path_iterator, but also yields the path of each file relative to
+    the search path it was found in, prefixed by the name of the search path.
+    yields (relative_path, source_path, dest_path).
+    '''
+    for search_path in paths:
+        root = Path(abspath(search_path))
+        for source_path, dest_path in path_iterator([search_path], output_path, paths_to_ignore):
+            relative = Path(abspath(source_path)).relative_to(root).as_posix()
+            yield root.name if relative == '.' else f'{root.name}/{relative}', source_path, dest_path
+
 def default_callback(file_path, future_result):
     if future_result.exception():
         print(f'error processing {file_path}, exception={future_result.exception()}', file=sys.stderr)
@@ -42,6 +66,12 @@ def process_directory(
     noise_suppressor: NoiseSuppressor, 
     on_processed_callback: Callable[[str, Future], None] = default_callback, 
     paths_to_ignore: list = [],
+    *,
+    shard: Shard = None,
+    telemetry: Telemetry = None,
+    governor: MemoryGovernor = None,
+    supervision: Supervision = None,
+    index: IndexSelection = None,
 ) -> List[Future]:
     """
         Process a whole directory of audio files with the desired noise supressor.
@@ -65,8 +95,24 @@ def process_directory(
 
         paths_to_ignore:
             list of paths or substrings to ignore when crawling to a directory. Example: ['log', '.avi', '.gitignore']
+
+        shard:
+            if given, only the files of this shard are processed. See process_directory_raw.
+
+        telemetry:
+            if given, it tracks the progress of the run. See process_directory_raw.
+
+        governor:
+            if given, limits the memory used by concurrent files. See process_directory_raw.
+
+        supervision:
+            if given, crashed and hung workers are replaced and their files retried. See process_directory_raw.
+
+        index:
+            if given, the files are listed from a corpus index instead of walking the directories. See process_directory_raw.
     """
-    return process_directory_raw(in_dir, out_dir, noise_supressor.process_signal_file, on_processed_callback, paths_to_ignore)
+    return process_directory_raw(in_dirs, out_dir, noise_suppressor.process_signal_file, on_processed_callback, paths_to_ignore,
+                                 shard=shard, telemetry=telemetry, governor=governor, supervision=supervision, index=index)
 
 def process_directory_raw(
     in_dirs: List[str], 
@@ -74,6 +120,12 @@ def process_directory_raw(
     f: Callable[[str, str], None], 
     on_processed_callback: Callable[[str, Future], None] = default_callback, 
     paths_to_ignore: list = [],
+    *,
+    shard: Shard = None,
+    telemetry: Telemetry = None,
+    governor: MemoryGovernor = None,
+    supervision: Supervision = None,
+    index: IndexSelection = None,
 ) -> List[Future]:
     """
         Process a whole directory of audio files with the desired function.
@@ -97,16 +149,193 @@ def process_directory_raw(
 
         paths_to_ignore:
             list of paths or substrings to ignore when crawling to a directory. Example: ['log', '.avi', '.gitignore']
+
+        shard:
+            if given, only the files of this shard are processed, and the shard's manifest
+            records the result of each one of them. See common.sharding.Shard.
+
+        telemetry:
+            if given, tracks rates, queue depth, worker utilization and errors while the
+            run progresses, and reports them periodically. See common.telemetry.Telemetry.
+
+        governor:
+            if given, a file is only submitted when its estimated peak memory, added to
+            the estimates of the files being processed, fits the governor's budget.
+            See common.memory_governor.MemoryGovernor.
+
+        supervision:
+            if given, the files are processed by a SupervisedPool instead of a ProcessPoolExecutor.
+            A worker that crashes or hangs no longer breaks the whole pool: it is replaced, and its
+            file is retried or quarantined. See common.supervised_pool.SupervisedPool.
+
+        index:
+            if given, the files are listed from a selection of a corpus index, which has to be up to
+            date with in_dirs (see CorpusIndex.scan), instead of walking the directories. The
+            durations in the index are used by the shard, the telemetry and the governor, so
+            no file is opened before being processed. See common.corpus_index.CorpusIndex.
     """
-    if out_dir is not None:
-        makedirs(out_dir, exist_ok=True)
+    entries, durations = _entries(in_dirs, out_dir, paths_to_ignore, shard, index)
+    pool = _start_pool(telemetry, supervision)
     futures = []
 
-    with ProcessPoolExecutor(max_workers=cpu_count()) as pool:
-        for source_path, dest_path in path_iterator(in_dirs, out_dir, paths_to_ignore):
-            bound_callback = partial(on_processed_callback, source_path)
-            future = pool.submit(f, source_path, dest_path)
-            future.add_done_callback(bound_callback)
+    with pool:
+        for job_id, entry in enumerate(entries):
+            future = _submit(pool, f, job_id, entry, durations, shard, telemetry, governor)
+            future.add_done_callback(partial(on_processed_callback, entry[1]))
             futures.append(future)
 
-    return futures
\ No newline at end of file
+    if telemetry is not None:
+        telemetry.stop()
+
+    return futures
+
+@dataclass
+class ProcessedFile:
+    source_path: str
+    dest_path: str
+    result: Any = None
+    exception: BaseException = None
+
+def iter_process_directory(
+    in_dirs: List[str],
+    out_dir: str,
+    noise_suppressor: NoiseSuppressor,
+    max_pending: int = None,
+    **kwargs,
+) -> Iterator[ProcessedFile]:
+    """
+        Same as iter_process_directory_raw, processing the audios with the desired noise suppressor.
+    """
+    return iter_process_directory_raw(in_dirs, out_dir, noise_suppressor.process_signal_file, max_pending, **kwargs)
+
+def iter_process_directory_raw(
+    in_dirs: List[str],
+    out_dir: str,
+    f: Callable[[str, str], Any],
+    max_pending: int = None,
+    paths_to_ignore: list = [],
+    *,
+    shard: Shard = None,
+    telemetry: Telemetry = None,
+    governor: MemoryGovernor = None,
+    supervision: Supervision = None,
+    index: IndexSelection = None,
+) -> Iterator[ProcessedFile]:
+    """
+        Same as process_directory_raw, but yields a ProcessedFile for each file as soon as it
+        is done, in the order they finish, instead of returning futures once everything is done.
+        A file that failed is yielded with its exception.
+
+        max_pending (2 * cpu_count()):
+            at most this many files are submitted and not yet consumed. When the caller stops
+            consuming, no new files are submitted, so neither the results nor the futures pile
+            up in memory, however big the corpus is.
+
+        Closing the generator early (break, or an exception in the caller) cancels the files
+        that did not start yet, and waits for the running ones.
+        The shard manifest and the telemetry are updated before each file is yielded.
+    """
+    max_pending = max_pending or 2 * cpu_count()
+    entries, durations = _entries(in_dirs, out_dir, paths_to_ignore, shard, index)
+    pool = _start_pool(telemetry, supervision)
+    done = Queue()
+    pending = set()
+
+    def finished(source_path, dest_path, future: Future):
+        if future.cancelled():
+            return
+        exception = future.exception()
+        done.put((future, ProcessedFile(source_path, dest_path, None if exception else future.result(), exception)))
+
+    def take():
+        future, processed = done.get()
+        pending.discard(future)
+        return processed
+
+    try:
+        for job_id, entry in enumerate(entries):
+            while len(pending) >= max_pending:
+                yield take()
+            future = _submit(pool, f, job_id, entry, durations, shard, telemetry, governor)
+            pending.add(future)
+            future.add_done_callback(partial(finished, entry[1], entry[2]))
+        while pending:
+            yield take()
+    finally:
+        for future in pending:
+            future.cancel()
+        pool.shutdown(wait=True)
+        if telemetry is not None:
+            telemetry.stop()
+
+async def aiter_process_directory_raw(*args, **kwargs) -> AsyncIterator[ProcessedFile]:
+    """
+        Async version of iter_process_directory_raw, with the same arguments. The waits
+        for results (and for the memory governor) happen on the default executor,
+        so the event loop is never blocked.
+    """
+    loop = asyncio.get_running_loop()
+    results = iter_process_directory_raw(*args, **kwargs)
+    finished = object()
+    try:
+        while True:
+            processed = await loop.run_in_executor(None, next, results, finished)
+            if processed is finished:
+                return
+            yield processed
+    finally:
+        await loop.run_in_executor(None, results.close)
+
+def _entries(in_dirs, out_dir, paths_to_ignore, shard, index):
+    '''
+    the (relative_path, source_path, dest_path) of the files to process, and the
+    durations known from the index, by source path.
+    '''
+    if out_dir is not None:
+        makedirs(out_dir, exist_ok=True)
+
+    durations = {}
+    if index is not None:
+        indexed = index.entries(in_dirs, out_dir, paths_to_ignore)
+        durations = {str(source_path): duration for _, source_path, _, duration in indexed}
+        entries = [(relative_path, source_path, dest_path) for relative_path, source_path, dest_path, _ in indexed]
+        if shard is not None:
+            entries = shard.select(entries, durations)
+    elif shard is None:
+        entries = ((None, source_path, dest_path) for source_path, dest_path in path_iterator(in_dirs, out_dir, paths_to_ignore))
+    else:
+        entries = shard.select(relative_path_iterator(in_dirs, out_dir, paths_to_ignore))
+    return entries, durations
+
+def _start_pool(telemetry, supervision):
+    pool_arguments = {}
+    if telemetry is not None:
+        pool_arguments = {'initializer': init_worker, 'initargs': (telemetry.events,)}
+        telemetry.start()
+
+    if supervision is None:
+        return ProcessPoolExecutor(max_workers=cpu_count(), **pool_arguments)
+    if telemetry is not None:
+        pool_arguments['on_worker_lost'] = telemetry.worker_lost
+    return SupervisedPool(cpu_count(), supervision=supervision, **pool_arguments)
+
+def _submit(pool, f, job_id, entry, durations, shard, telemetry, governor) -> Future:
+    '''
+    submits one file, waiting for the governor if needed, and hooks the shard,
+    telemetry and governor to its future.
+    '''
+    relative_path, source_path, dest_path = entry
+    if governor is not None:
+        cost = governor.estimate(source_path, durations.get(str(source_path)))
+        governor.acquire(cost)
+    if telemetry is None:
+        future = pool.submit(f, source_path, dest_path)
+    else:
+        telemetry.job_submitted(job_id, source_path, durations.get(str(source_path)))
+        future = pool.submit(timed_call, job_id, f, source_path, dest_path)
+        future.add_done_callback(partial(telemetry.job_done, job_id))
+    if governor is not None:
+        future.add_done_callback(partial(governor.release, cost))
+    if shard is not None:
+        future.add_done_callback(partial(shard.record, relative_path))
+    return future
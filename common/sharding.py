@@ -0,0 +1,183 @@
+import hashlib
+import json
+import threading
+from concurrent.futures import Future
+from typing import Dict, Iterable, List, Tuple
+import soundfile as sf
+
+
+def parse_shard(spec: str) -> Tuple[int, int]:
+    '''
+    parses a shard specification "i/N", where 0 <= i < N.
+    '''
+    try:
+        index, count = (int(x) for x in spec.split('/'))
+    except ValueError:
+        raise Exception(f'invalid shard "{spec}", expected i/N')
+    if count < 1 or not 0 <= index < count:
+        raise Exception(f'invalid shard "{spec}", expected 0 <= i < N')
+    return index, count
+
+
+def shard_of(relative_path: str, count: int) -> int:
+    '''
+    the shard of a file, by a hash of its relative path. It is the same on every machine,
+    unlike python's hash().
+    '''
+    digest = hashlib.sha1(relative_path.encode('utf-8')).hexdigest()
+    return int(digest, 16) % count
+
+
+def audio_duration(path) -> float:
+    ''' duration in seconds read from the file header, or 0 if it cannot be read. '''
+    try:
+        return sf.info(str(path)).duration
+    except Exception:
+        return 0.0
+
+
+def balanced_shards(relative_paths: List[str], durations: List[float], count: int) -> List[int]:
+    '''
+    assigns each file to a shard so that the total duration of the shards is balanced:
+    the longest files are placed first, always in the shard with the least audio.
+    Ties are broken by path and shard index, so it is deterministic.
+    '''
+    loads = [0.0] * count
+    shards = [0] * len(relative_paths)
+    order = sorted(range(len(relative_paths)), key=lambda i: (-durations[i], relative_paths[i]))
+    for i in order:
+        shard = min(range(count), key=lambda s: (loads[s], s))
+        shards[i] = shard
+        loads[shard] += durations[i]
+    return shards
+
+
+class Shard:
+
+    def __init__(self, index: int, count: int, balance_by_duration: bool = False):
+        """
+            Selects the part of a corpus processed by one of count nodes, and keeps
+            a manifest of what happened with each of its files.
+
+            By default, files are partitioned by a hash of their relative path, so each node
+            only needs to know its own files. With balance_by_duration, every node reads the
+            duration of every file (only the headers) and they are partitioned so each shard
+            has about the same amount of audio.
+        """
+        self.index = index
+        self.count = count
+        self.balance_by_duration = balance_by_duration
+        self.corpus_size = 0
+        self.corpus_digest = None
+        self.files = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def from_spec(spec: str, balance_by_duration: bool = False):
+        return Shard(*parse_shard(spec), balance_by_duration)
+
+    @property
+    def spec(self):
+        return f'{self.index}/{self.count}'
+
+    def select(self, entries: Iterable[Tuple[str, str, str]], durations: Dict[str, float] = None) -> List[Tuple[str, str, str]]:
+        """
+            Receives (relative_path, source, dest) for every file in the corpus,
+            and returns the ones that belong to this shard.
+            durations, by source path, are used instead of reading the headers when given.
+        """
+        entries = sorted(entries, key=lambda entry: entry[0])
+        relative_paths = [relative for relative, *_ in entries]
+
+        digest = hashlib.sha1()
+        for relative in relative_paths:
+            digest.update(relative.encode('utf-8') + b'\0')
+        self.corpus_size = len(entries)
+        self.corpus_digest = digest.hexdigest()
+
+        if self.balance_by_duration:
+            if durations is None:
+                durations = {str(source): audio_duration(source) for _, source, _ in entries}
+            shards = balanced_shards(relative_paths, [durations[str(source)] or 0.0 for _, source, _ in entries], self.count)
+        else:
+            shards = [shard_of(relative, self.count) for relative in relative_paths]
+
+        selected = [entry for entry, shard in zip(entries, shards) if shard == self.index]
+        self.files = {
+            relative: {'path': relative, 'source': str(source), 'status': 'pending', 'error': None}
+            for relative, source, _ in selected
+        }
+        return selected
+
+    def record(self, relative_path: str, future: Future):
+        ''' done callback: stores the result of a file in the manifest. '''
+        with self.lock:
+            entry = self.files[relative_path]
+            if future.cancelled():
+                entry['status'] = 'cancelled'
+            elif future.exception() is not None:
+                entry['status'] = 'error'
+                entry['error'] = str(future.exception())
+            else:
+                entry['status'] = 'ok'
+
+    def write_manifest(self, filename: str, statistics_part: str = None):
+        with self.lock:
+            manifest = {
+                'shard': self.spec,
+                'balance_by_duration': self.balance_by_duration,
+                'corpus_size': self.corpus_size,
+                'corpus_digest': self.corpus_digest,
+                'statistics_part': statistics_part,
+                'files': list(self.files.values()),
+            }
+        with open(filename, 'w') as f:
+            json.dump(manifest, f, indent=2)
+
+
+def rejected_files(manifests: List[dict]) -> List[dict]:
+    ''' the entries of the files that were processed, but failed. '''
+    return [entry for manifest in manifests for entry in manifest['files'] if entry['status'] == 'error']
+
+
+def verify_manifests(manifests: List[dict], allow_errors: bool = False) -> List[str]:
+    '''
+    checks that the manifests of all shards of a run cover the whole corpus,
+    each file exactly once, and that every file was processed.
+    With allow_errors, files that were processed but failed (like the ones rejected
+    for being too short) are not problems: only pending and cancelled files are.
+    Returns a list of problems, empty if the run is complete.
+    '''
+    if len(manifests) == 0:
+        return ['no manifests given']
+
+    problems = []
+    counts = {parse_shard(manifest['shard'])[1] for manifest in manifests}
+    if len(counts) > 1:
+        problems.append(f'manifests are from runs with different shard counts: {sorted(counts)}')
+    digests = {(manifest['corpus_size'], manifest['corpus_digest']) for manifest in manifests}
+    if len(digests) > 1:
+        problems.append('manifests saw different corpora')
+
+    count = max(counts)
+    indices = [parse_shard(manifest['shard'])[0] for manifest in manifests]
+    missing = sorted(set(range(count)) - set(indices))
+    if missing:
+        problems.append(f'missing shards: {", ".join(f"{i}/{count}" for i in missing)}')
+    repeated = sorted({i for i in indices if indices.count(i) > 1})
+    if repeated:
+        problems.append(f'repeated shards: {", ".join(f"{i}/{count}" for i in repeated)}')
+
+    seen = set()
+    for manifest in manifests:
+        for entry in manifest['files']:
+            if entry['path'] in seen:
+                problems.append(f'{entry["path"]} is in more than one shard')
+            seen.add(entry['path'])
+            if entry['status'] != 'ok' and not (allow_errors and entry['status'] == 'error'):
+                problems.append(f'{entry["path"]} was not processed: {entry["status"]} {entry["error"] or ""}'.rstrip())
+
+    corpus_size = manifests[0]['corpus_size']
+    if not missing and len(seen) != corpus_size:
+        problems.append(f'shards cover {len(seen)} files, but the corpus has {corpus_size}')
+    return problems
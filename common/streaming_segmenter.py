@@ -0,0 +1,223 @@
+from collections import deque
+from typing import List, Tuple
+import numpy as np
+
+from .noise_suppressor import NoiseSuppressor
+
+
+class StreamingSegmenter(NoiseSuppressor):
+
+    def __init__(self, sr, window_size=4096, warmup_seconds=1.0, min_dynamic_range_db=6.0, **kwargs):
+        """
+            Creates an incremental voice/pause segmenter, that marks speech and pauses
+            while the audio is still being recorded.
+
+            It uses the same sliding window energy, threshold and majority filter as
+            NoiseSuppressor.noise_sel, but the minimum and maximum energies are running
+            estimates instead of global ones. Besides the NoiseSuppressor parameters,
+            it receives:
+
+            sr:
+                sample rate of the chunks that will be fed.
+
+            window_size (4096):
+                size of the sliding window used to calculate the energy.
+
+            warmup_seconds (1.0):
+                how much audio we buffer before taking the first decision. As in
+                noise_sel, the first 0.5s are not used to estimate the noise floor,
+                so this should be bigger than 0.5s.
+
+            min_dynamic_range_db (6.0):
+                while the difference between the loudest and the quietest energies seen
+                is smaller than this, everything is considered noise. Otherwise a recording
+                that starts with silence would have its noise split by a meaningless threshold.
+                Only used when noise_threshold_db is None.
+
+            Decisions are emitted with a latency of, at most, the warmup at the start
+            of the recording, and window_size + bool_filter_window_size samples afterwards.
+        """
+        super().__init__(**kwargs)
+        self.sr = sr
+        self.window_size = window_size
+        self.min_dynamic_range_db = min_dynamic_range_db
+
+        self.__imin = int(0.5 * sr)
+        self.__warmup = max(int(warmup_seconds * sr), self.__imin + 1)
+        self.__filter_size = int(self.bool_filter_window_size or 0.2 * sr)
+
+        # energy state: the last window_size - 1 squared samples seen. The energy of a
+        # sample is the mean of the window starting on it, so the first window_size - 1
+        # windows that end on the leading zeros are thrown away.
+        self.__tail = np.zeros(window_size - 1)
+        self.__to_skip = window_size - 1
+        self.__n_samples = 0
+        self.__edB_min = np.inf
+        self.__edB_max = -np.inf
+        self.__warmup_edB = []
+
+        # majority filter state. The padded stream starts with N True values,
+        # exactly like the offline filter.
+        self.__n_true = self.__filter_size
+        self.__n_false = 0
+        self.__n_votes = self.__filter_size
+        self.__history = deque()
+        self.__n_out = 0
+
+        # current (not yet finalized) interval
+        self.__current_is_signal = None
+        self.__current_start = 0
+        self.__flushed = False
+
+    @property
+    def noise_floor(self):
+        ''' current estimate of the minimum energy (in dB), or None during warmup. '''
+        return None if np.isinf(self.__edB_min) else self.__edB_min
+
+    def process(self, chunk) -> List[Tuple[bool, int, int]]:
+        """
+            Feeds a chunk of audio to the segmenter.
+            Returns the intervals finalized by this chunk, as tuples of
+            (is_signal, start_sample, end_sample), with end_sample exclusive.
+        """
+        if self.__flushed:
+            raise Exception('Cannot process audio after the segmenter was flushed')
+
+        edB = self.__chunk_energy(np.asarray(chunk, dtype=np.float64))
+        first = self.__n_samples
+        self.__n_samples += len(edB)
+
+        if self.__warmup_edB is not None:
+            self.__warmup_edB.append(edB)
+            if self.__n_samples < self.__warmup:
+                return []
+            edB = np.concatenate(self.__warmup_edB)
+            self.__warmup_edB = None
+            first = 0
+
+        return self.__classify(edB, first)
+
+    def flush(self) -> List[Tuple[bool, int, int]]:
+        """
+            Signals the end of the recording, finalizing every pending decision.
+            Returns the remaining intervals.
+        """
+        if self.__flushed:
+            return []
+
+        # the last windows go past the end of the signal, and see zeros there.
+        edB = self.__chunk_energy(np.zeros(self.window_size - 1))
+        first = self.__n_samples
+        self.__n_samples += len(edB)
+
+        intervals = []
+        if self.__warmup_edB is not None:
+            self.__warmup_edB.append(edB)
+            edB = np.concatenate(self.__warmup_edB)
+            self.__warmup_edB = None
+            intervals += self.__classify(edB, 0, whole_signal=True)
+        else:
+            intervals += self.__classify(edB, first)
+
+        # pads the end of the stream with N + 1 True values, as the offline filter does.
+        intervals += self.__vote(np.ones(self.__filter_size + 1, dtype=bool))
+
+        if self.__current_is_signal is not None and self.__current_start < self.__n_out:
+            intervals.append((self.__current_is_signal, self.__current_start, self.__n_out))
+        self.__flushed = True
+        return intervals
+
+    def __chunk_energy(self, chunk):
+        """
+            Calculates the mean energy (in dB) of the new samples, the same way
+            NoiseSuppressor's sliding window does, carrying the end of the
+            previous chunk over.
+        """
+        y2 = np.concatenate((self.__tail, np.power(chunk, 2)))
+        window = np.ones(self.window_size) / float(self.window_size)
+        convolution = np.convolve(y2, window, mode='valid')
+        self.__tail = y2[len(y2) - (self.window_size - 1):]
+
+        skip = min(self.__to_skip, len(convolution))
+        self.__to_skip -= skip
+        convolution = convolution[skip:]
+
+        edB = np.full(len(convolution), -np.inf)
+        np.log10(convolution, out=edB, where=convolution > 0)
+        return 10 * edB
+
+    def __update_floor(self, edB, first, whole_signal=False):
+        """
+            Updates the running minimum and maximum energies, ignoring the initial
+            0.5s of the signal, just like the offline selection does.
+        """
+        valid = edB[max(self.__imin - first, 0):]
+        if whole_signal and self.__imin > 0:
+            valid = valid[:-self.__imin]
+        valid = valid[np.isfinite(valid)]
+        if len(valid) > 0:
+            self.__edB_min = min(self.__edB_min, np.min(valid))
+            self.__edB_max = max(self.__edB_max, np.max(valid))
+
+    def __classify(self, edB, first, whole_signal=False):
+        self.__update_floor(edB, first, whole_signal)
+        if np.isinf(self.__edB_min):
+            # no valid energy at all: everything is noise.
+            return self.__vote(np.ones(len(edB), dtype=bool))
+
+        noise_threshold = self.noise_threshold_db
+        if noise_threshold is None:
+            dynamic_range = self.__edB_max - self.__edB_min
+            if dynamic_range < self.min_dynamic_range_db:
+                return self.__vote(np.ones(len(edB), dtype=bool))
+            noise_threshold = self.noise_threshold_pct * dynamic_range
+
+        is_noise_pre = edB < self.__edB_min + noise_threshold
+        return self.__vote(is_noise_pre)
+
+    def __vote(self, votes):
+        """
+            Incremental version of the boolean majority filter. The first 2N + 1 votes
+            of the padded stream only fill the window; each vote after that
+            finalizes one more sample.
+        """
+        N = self.__filter_size
+        intervals = []
+        history = self.__history
+
+        for vote in votes:
+            if self.__n_votes < 2 * N + 1:
+                self.__n_votes += 1
+                if vote:
+                    self.__n_true += 1
+                else:
+                    self.__n_false += 1
+                continue
+
+            out = self.__n_true > self.__n_false
+            history.append(out)
+
+            if self.__n_out >= N:
+                to_remove = history.popleft()
+            else:  # remove one "True" that we padded.
+                to_remove = True
+
+            if to_remove:
+                self.__n_true -= 1
+            else:
+                self.__n_false -= 1
+
+            if vote:
+                self.__n_true += 1
+            else:
+                self.__n_false += 1
+
+            is_signal = not out
+            if is_signal != self.__current_is_signal:
+                if self.__current_is_signal is not None:
+                    intervals.append((self.__current_is_signal, self.__current_start, self.__n_out))
+                self.__current_is_signal = is_signal
+                self.__current_start = self.__n_out
+            self.__n_out += 1
+
+        return intervals
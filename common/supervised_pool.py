@@ -0,0 +1,256 @@
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from concurrent.futures import Future
+from multiprocessing.connection import wait
+from typing import Callable
+
+
+class JobQuarantined(Exception):
+    ''' a job failed on every attempt it was given, and will not be retried anymore. '''
+
+    def __init__(self, description: str, attempts: int, errors: list):
+        super().__init__(f'{description} quarantined after {attempts} attempts: {errors[-1]}')
+        self.description = description
+        self.attempts = attempts
+        self.errors = errors
+
+
+class Supervision:
+
+    def __init__(self, retries: int = 2, job_timeout: float = None, quarantine_file: str = None, retry_exceptions: bool = False):
+        """
+            How a SupervisedPool handles failures.
+
+            retries (2):
+                how many times a job is run again after its worker died or timed out.
+
+            job_timeout (None):
+                seconds a job can run before its worker is killed. None waits forever.
+
+            quarantine_file (None):
+                if given, a json line with the errors of each quarantined job is appended to it.
+
+            retry_exceptions (False):
+                also retry jobs that raised an exception. By default, only crashes and timeouts
+                are retried, since an exception usually happens again on every attempt.
+        """
+        self.retries = retries
+        self.job_timeout = job_timeout
+        self.quarantine_file = quarantine_file
+        self.retry_exceptions = retry_exceptions
+
+
+def _worker_loop(connection, initializer, initargs):
+    if initializer is not None:
+        initializer(*initargs)
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            return
+        if message is None:
+            return
+        job_id, f, args = message
+        try:
+            reply = (job_id, True, f(*args))
+        except BaseException as e:
+            reply = (job_id, False, (e, ''.join(traceback.format_exception(type(e), e, e.__traceback__)).rstrip()))
+        try:
+            connection.send(reply)
+        except Exception as e:
+            # the result or the exception could not be pickled
+            connection.send((job_id, False, (Exception(f'could not send the result: {e}'), None)))
+
+
+class _Job:
+    def __init__(self, job_id, f, args):
+        self.job_id = job_id
+        self.f = f
+        self.args = args
+        self.future = Future()
+        self.attempts = 0
+        self.errors = []
+
+    @property
+    def description(self):
+        ''' the first path in the arguments, which is the file being processed. '''
+        return next((str(arg) for arg in self.args if isinstance(arg, (str, os.PathLike))), f'job {self.job_id}')
+
+
+class _Worker:
+    def __init__(self, context, initializer, initargs):
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(target=_worker_loop, args=(child_connection, initializer, initargs), daemon=True)
+        self.process.start()
+        child_connection.close()
+        self.job = None
+        self.deadline = None
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.connection.close()
+
+
+class SupervisedPool:
+
+    def __init__(self, max_workers: int, initializer: Callable = None, initargs: tuple = (), supervision: Supervision = None,
+                 on_worker_lost: Callable[[int], None] = None):
+        """
+            A process pool where each worker runs one job at a time, so we always know
+            which job a worker had. A worker that dies (killed by the OOM killer, a segfault
+            on a native decoder...) or that takes longer than the timeout is replaced by a new one,
+            and its job is run again, up to the retry limit. Jobs that keep failing are
+            quarantined: their future fails with JobQuarantined, and the other jobs go on.
+
+            It can be used in place of a ProcessPoolExecutor, through submit and shutdown.
+            on_worker_lost is called with the pid of each worker that is replaced.
+        """
+        self.supervision = supervision or Supervision()
+        self.initializer = initializer
+        self.initargs = initargs
+        self.on_worker_lost = on_worker_lost
+        self.context = multiprocessing.get_context()
+        self.lock = threading.Lock()
+        self.pending = deque()
+        self.next_id = 0
+        self.closing = False
+        self.quarantined = []
+
+        self.workers = [self.__spawn() for _ in range(max_workers)]
+        self.wakeup_read, self.wakeup_write = self.context.Pipe(duplex=False)
+        self.thread = threading.Thread(target=self.__supervise, daemon=True)
+        self.thread.start()
+
+    def submit(self, f, *args) -> Future:
+        with self.lock:
+            if self.closing:
+                raise RuntimeError('cannot submit jobs after shutdown')
+            job = _Job(self.next_id, f, args)
+            self.next_id += 1
+            self.pending.append(job)
+        self.__wake_up()
+        return job.future
+
+    def shutdown(self, wait=True):
+        with self.lock:
+            self.closing = True
+        self.__wake_up()
+        if wait:
+            self.thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.shutdown(wait=True)
+        return False
+
+    def __spawn(self):
+        return _Worker(self.context, self.initializer, self.initargs)
+
+    def __wake_up(self):
+        try:
+            self.wakeup_write.send(None)
+        except OSError:
+            pass
+
+    def __assign(self):
+        with self.lock:
+            for worker in self.workers:
+                if worker.job is not None:
+                    continue
+                # retried jobs are already running, new ones may have been cancelled.
+                while self.pending and self.pending[0].attempts == 0 and not self.pending[0].future.set_running_or_notify_cancel():
+                    self.pending.popleft()
+                if not self.pending:
+                    return
+                job = self.pending.popleft()
+                job.attempts += 1
+                worker.job = job
+                worker.deadline = None if self.supervision.job_timeout is None else time.monotonic() + self.supervision.job_timeout
+                try:
+                    worker.connection.send((job.job_id, job.f, job.args))
+                except Exception as e:
+                    worker.job = None
+                    job.future.set_exception(e)
+
+    def __failed(self, job: _Job, error: str, retriable: bool):
+        job.errors.append(error)
+        if retriable and job.attempts <= self.supervision.retries:
+            print(f'retrying {job.description} (attempt {job.attempts + 1}): {error}', file=sys.stderr)
+            with self.lock:
+                self.pending.appendleft(job)
+            return
+
+        exception = JobQuarantined(job.description, job.attempts, job.errors)
+        self.quarantined.append(exception)
+        if self.supervision.quarantine_file is not None:
+            with open(self.supervision.quarantine_file, 'a') as f:
+                f.write(json.dumps({'job': job.description, 'attempts': job.attempts, 'errors': job.errors}) + '\n')
+        job.future.set_exception(exception)
+
+    def __replace(self, worker: _Worker, error: str):
+        job = worker.job
+        worker.kill()
+        if self.on_worker_lost is not None:
+            self.on_worker_lost(worker.process.pid)
+        self.workers[self.workers.index(worker)] = self.__spawn()
+        self.__failed(job, error, retriable=True)
+
+    def __supervise(self):
+        while True:
+            self.__assign()
+
+            with self.lock:
+                busy = [worker for worker in self.workers if worker.job is not None]
+                if self.closing and not busy and not self.pending:
+                    break
+
+            deadlines = [worker.deadline for worker in busy if worker.deadline is not None]
+            timeout = 1.0 if not deadlines else max(min(deadlines) - time.monotonic(), 0)
+            waitables = [self.wakeup_read] + [worker.connection for worker in busy] + [worker.process.sentinel for worker in busy]
+            ready = wait(waitables, timeout=min(timeout, 1.0))
+
+            if self.wakeup_read in ready:
+                while self.wakeup_read.poll():
+                    self.wakeup_read.recv()
+
+            for worker in busy:
+                job = worker.job
+                if worker.connection.poll():
+                    try:
+                        job_id, ok, result = worker.connection.recv()
+                    except (EOFError, OSError):
+                        self.__replace(worker, f'worker {worker.process.pid} died (exit code {worker.process.exitcode})')
+                        continue
+                    worker.job = None
+                    if ok:
+                        job.future.set_result(result)
+                    elif self.supervision.retry_exceptions:
+                        exception, formatted = result
+                        self.__failed(job, formatted or str(exception), retriable=True)
+                    else:
+                        job.future.set_exception(result[0])
+                elif not worker.process.is_alive():
+                    worker.process.join()
+                    self.__replace(worker, f'worker {worker.process.pid} died (exit code {worker.process.exitcode})')
+                elif worker.deadline is not None and time.monotonic() >= worker.deadline:
+                    self.__replace(worker, f'timed out after {self.supervision.job_timeout}s')
+
+        for worker in self.workers:
+            try:
+                worker.connection.send(None)
+            except OSError:
+                pass
+        for worker in self.workers:
+            worker.process.join(timeout=5)
+            if worker.process.is_alive():
+                worker.process.kill()
+            worker.connection.close()
@@ -0,0 +1,256 @@
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from queue import Empty
+
+from .sharding import audio_duration
+
+# queue where the workers send their events. Set on each worker by init_worker.
+_worker_events = None
+
+
+def init_worker(events):
+    global _worker_events
+    _worker_events = events
+
+
+def timed_call(job_id: int, f, *args):
+    '''
+    runs f(*args) on a worker, telling the telemetry when the job started and ended.
+    '''
+    pid = os.getpid()
+    _worker_events.put(('start', job_id, pid, time.time()))
+    ok = False
+    try:
+        result = f(*args)
+        ok = True
+        return result
+    finally:
+        _worker_events.put(('end', job_id, pid, time.time(), ok))
+
+
+class WorkerStatistics:
+    def __init__(self):
+        self.busy_seconds = 0.0
+        self.jobs = 0
+        self.errors = 0
+        self.current_start = None
+
+
+class Telemetry:
+
+    def __init__(self, metrics_file: str = None, interval: float = 5.0, display: bool = False, rate_window: float = 60.0):
+        """
+            Keeps track of the progress of a batch run, and periodically reports it.
+
+            metrics_file:
+                if given, a Prometheus textfile (for node_exporter's textfile collector)
+                rewritten at every interval.
+
+            interval:
+                seconds between reports.
+
+            display:
+                shows a compact, single line status on stderr.
+
+            rate_window:
+                the recent rates (files and audio seconds per second) are measured over this many seconds.
+        """
+        self.metrics_file = metrics_file
+        self.interval = interval
+        self.display = display
+        self.rate_window = rate_window
+
+        self.events = multiprocessing.Queue()
+        self.lock = threading.Lock()
+        self.start_time = time.time()
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.audio_seconds = 0.0
+        self.durations = {}
+        self.running = {}
+        self.running_pids = {}
+        self.workers = {}
+        self.lost_pids = set()
+        self.history = [(self.start_time, 0, 0.0)]
+
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.start_time = time.time()
+        self.history = [(self.start_time, 0, 0.0)]
+        self.thread = threading.Thread(target=self.__report_loop, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        ''' stops the periodic reports, writing a last one. '''
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.__drain_events()
+        self.report()
+        if self.display:
+            print(file=sys.stderr)
+
+    def job_submitted(self, job_id: int, source_path, duration: float = None):
+        if duration is None:
+            duration = audio_duration(source_path)
+        with self.lock:
+            self.submitted += 1
+            self.durations[job_id] = duration
+
+    def job_done(self, job_id: int, future: Future):
+        ''' done callback of the job's future. '''
+        with self.lock:
+            duration = self.durations.pop(job_id, 0.0)
+            # its worker may have been killed before telling that the job ended.
+            self.running.pop(job_id, None)
+            self.running_pids.pop(job_id, None)
+            if future.cancelled():
+                self.submitted -= 1
+            elif future.exception() is not None:
+                self.failed += 1
+            else:
+                self.completed += 1
+                self.audio_seconds += duration
+
+    def worker_lost(self, pid: int):
+        '''
+        a worker was killed or died, and will never tell that its job ended: it is
+        forgotten, along with its job and any event it still has in the queue.
+        '''
+        self.__drain_events()
+        with self.lock:
+            self.lost_pids.add(pid)
+            self.workers.pop(pid, None)
+            for job_id in [job_id for job_id, job_pid in self.running_pids.items() if job_pid == pid]:
+                self.running.pop(job_id, None)
+                self.running_pids.pop(job_id, None)
+
+    def snapshot(self) -> dict:
+        self.__drain_events()
+        now = time.time()
+        with self.lock:
+            done = self.completed + self.failed
+            self.history.append((now, self.completed, self.audio_seconds))
+            while len(self.history) > 2 and self.history[1][0] < now - self.rate_window:
+                self.history.pop(0)
+            then, then_completed, then_audio = self.history[0]
+
+            window = max(now - then, 1e-9)
+            elapsed = max(now - self.start_time, 1e-9)
+            files_per_second = (self.completed - then_completed) / window
+            remaining = self.submitted - done
+
+            return {
+                'elapsed': elapsed,
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'failed': self.failed,
+                'audio_seconds': self.audio_seconds,
+                'in_flight': len(self.running),
+                'queued': max(remaining - len(self.running), 0),
+                'files_per_second': files_per_second,
+                'audio_seconds_per_second': (self.audio_seconds - then_audio) / window,
+                'eta': remaining / files_per_second if files_per_second > 0 else None,
+                'oldest_job_seconds': now - min(self.running.values()) if self.running else 0.0,
+                'workers': {
+                    pid: {
+                        'utilization': min((worker.busy_seconds + (now - worker.current_start if worker.current_start else 0)) / elapsed, 1.0),
+                        'jobs': worker.jobs,
+                        'errors': worker.errors,
+                    }
+                    for pid, worker in self.workers.items()
+                },
+            }
+
+    def report(self):
+        snapshot = self.snapshot()
+        if self.metrics_file is not None:
+            self.__write_metrics(snapshot)
+        if self.display:
+            self.__display(snapshot)
+
+    def __drain_events(self):
+        while True:
+            try:
+                event = self.events.get_nowait()
+            except (Empty, OSError, ValueError):
+                return
+            with self.lock:
+                kind, job_id, pid, timestamp, *rest = event
+                if pid in self.lost_pids:
+                    continue
+                worker = self.workers.setdefault(pid, WorkerStatistics())
+                if kind == 'start':
+                    if job_id in self.durations:
+                        self.running[job_id] = timestamp
+                        self.running_pids[job_id] = pid
+                    worker.current_start = timestamp
+                else:
+                    self.running.pop(job_id, None)
+                    self.running_pids.pop(job_id, None)
+                    if worker.current_start is not None:
+                        worker.busy_seconds += timestamp - worker.current_start
+                    worker.current_start = None
+                    worker.jobs += 1
+                    if not rest[0]:
+                        worker.errors += 1
+
+    def __report_loop(self):
+        while not self.stopped.wait(self.interval):
+            self.report()
+
+    def __write_metrics(self, snapshot):
+        prefix = 'noise_reduce'
+        lines = [
+            f'# TYPE {prefix}_files_submitted_total counter',
+            f'{prefix}_files_submitted_total {snapshot["submitted"]}',
+            f'# TYPE {prefix}_files_completed_total counter',
+            f'{prefix}_files_completed_total {snapshot["completed"]}',
+            f'# TYPE {prefix}_files_failed_total counter',
+            f'{prefix}_files_failed_total {snapshot["failed"]}',
+            f'# TYPE {prefix}_audio_seconds_total counter',
+            f'{prefix}_audio_seconds_total {snapshot["audio_seconds"]:.3f}',
+            f'# TYPE {prefix}_jobs_in_flight gauge',
+            f'{prefix}_jobs_in_flight {snapshot["in_flight"]}',
+            f'# TYPE {prefix}_jobs_queued gauge',
+            f'{prefix}_jobs_queued {snapshot["queued"]}',
+            f'# TYPE {prefix}_files_per_second gauge',
+            f'{prefix}_files_per_second {snapshot["files_per_second"]:.6f}',
+            f'# TYPE {prefix}_audio_seconds_per_second gauge',
+            f'{prefix}_audio_seconds_per_second {snapshot["audio_seconds_per_second"]:.6f}',
+            f'# TYPE {prefix}_oldest_job_seconds gauge',
+            f'{prefix}_oldest_job_seconds {snapshot["oldest_job_seconds"]:.3f}',
+            f'# TYPE {prefix}_elapsed_seconds gauge',
+            f'{prefix}_elapsed_seconds {snapshot["elapsed"]:.3f}',
+            f'# TYPE {prefix}_worker_utilization gauge',
+            *(f'{prefix}_worker_utilization{{pid="{pid}"}} {worker["utilization"]:.4f}' for pid, worker in snapshot['workers'].items()),
+            f'# TYPE {prefix}_worker_jobs_total counter',
+            *(f'{prefix}_worker_jobs_total{{pid="{pid}"}} {worker["jobs"]}' for pid, worker in snapshot['workers'].items()),
+            f'# TYPE {prefix}_worker_errors_total counter',
+            *(f'{prefix}_worker_errors_total{{pid="{pid}"}} {worker["errors"]}' for pid, worker in snapshot['workers'].items()),
+        ]
+        # write and rename, so the collector never reads a half written file
+        temporary = f'{self.metrics_file}.tmp'
+        with open(temporary, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(temporary, self.metrics_file)
+
+    def __display(self, snapshot):
+        eta = snapshot['eta']
+        eta = '?' if eta is None else f'{int(eta // 3600)}:{int(eta % 3600 // 60):02d}:{int(eta % 60):02d}'
+        workers = snapshot['workers'].values()
+        utilization = sum(worker['utilization'] for worker in workers) / len(workers) if workers else 0.0
+        line = (
+            f'{snapshot["completed"]}/{snapshot["submitted"]} done, {snapshot["failed"]} failed | '
+            f'{snapshot["files_per_second"]:.2f} files/s, {snapshot["audio_seconds_per_second"]:.1f} audio s/s | '
+            f'{snapshot["in_flight"]} running, {snapshot["queued"]} queued, oldest {snapshot["oldest_job_seconds"]:.0f}s | '
+            f'workers {100 * utilization:.0f}% busy | eta {eta}'
+        )
+        print(f'\r{line}\033[K', end='', file=sys.stderr, flush=True)
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# the command line tools import each other as top-level modules, as when they run from cli/.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'cli'))
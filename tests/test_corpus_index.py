@@ -0,0 +1,94 @@
+import os
+from dataclasses import asdict
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from common.corpus_index import CorpusIndex
+from common.process_directory import relative_path_iterator
+
+SR = 8000
+
+
+def write_audio(path, seconds):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    sf.write(str(path), np.zeros(int(seconds * SR)), SR)
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    root = tmp_path / 'corpus'
+    write_audio(root / 'a.wav', 0.5)
+    write_audio(root / 'speaker1' / 'b.wav', 2.0)
+    write_audio(root / 'speaker1' / 'c.wav', 3.0)
+    write_audio(root / 'speaker2' / 'deep' / 'd.wav', 5.0)
+    (root / 'speaker2' / 'broken.wav').write_bytes(b'not an audio file')
+    return root
+
+
+@pytest.fixture
+def index(tmp_path):
+    with CorpusIndex(str(tmp_path / 'index.sqlite')) as index:
+        yield index
+
+
+def test_first_scan_adds_every_file(corpus, index):
+    scan = index.scan([str(corpus)])
+    assert asdict(scan) == {'added': 5, 'updated': 0, 'removed': 0, 'unchanged': 0, 'unreadable': 1}
+
+    entries = {os.path.basename(entry.path): entry for entry in index.query()}
+    assert entries['c.wav'].duration == 3.0 and entries['c.wav'].samplerate == SR
+    assert entries['broken.wav'].duration is None and entries['broken.wav'].error is not None
+
+
+def test_scan_only_counts_what_changed(corpus, index):
+    index.scan([str(corpus)])
+    assert asdict(index.scan([str(corpus)])) == {'added': 0, 'updated': 0, 'removed': 0, 'unchanged': 5, 'unreadable': 0}
+
+    write_audio(corpus / 'speaker1' / 'b.wav', 4.0)
+    stat = os.stat(corpus / 'speaker1' / 'c.wav')
+    os.utime(corpus / 'speaker1' / 'c.wav', ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    os.remove(corpus / 'a.wav')
+    write_audio(corpus / 'speaker3' / 'e.wav', 1.5)
+
+    scan = index.scan([str(corpus)])
+    assert asdict(scan) == {'added': 1, 'updated': 2, 'removed': 1, 'unchanged': 2, 'unreadable': 0}
+    durations = {os.path.basename(entry.path): entry.duration for entry in index.query()}
+    assert durations == {'b.wav': 4.0, 'c.wav': 3.0, 'broken.wav': None, 'd.wav': 5.0, 'e.wav': 1.5}
+
+
+def test_scan_of_a_subdirectory_keeps_the_rest(corpus, index):
+    index.scan([str(corpus)])
+    os.remove(corpus / 'speaker1' / 'b.wav')
+    os.remove(corpus / 'a.wav')
+
+    scan = index.scan([str(corpus / 'speaker1')])
+    assert (scan.removed, scan.unchanged) == (1, 1)
+    assert len(index.query()) == 4
+
+
+def test_selection_filters_by_duration(corpus, index):
+    index.scan([str(corpus)])
+    selection = index.selection(min_duration=2.0, max_duration=5.0)
+    entries = selection.entries([str(corpus)], None, [])
+
+    names = {os.path.basename(relative_path): duration for relative_path, _, _, duration in entries}
+    # min_duration is exclusive, and the files without a readable header are kept
+    assert names == {'c.wav': 3.0, 'd.wav': 5.0, 'broken.wav': None}
+    assert selection.excluded == 2
+    assert selection.unreadable == 1
+
+
+@pytest.mark.parametrize('output', [None, 'out'])
+def test_selection_gives_the_paths_of_relative_path_iterator(corpus, index, tmp_path, output):
+    output_path = None if output is None else str(tmp_path / output)
+    paths = [str(corpus), str(corpus / 'speaker1' / 'c.wav')]
+    index.scan(paths)
+
+    entries = index.selection().entries(paths, output_path, ['.DS_Store'])
+    expected = relative_path_iterator(paths, output_path, ['.DS_Store'])
+    assert sorted((relative, str(source), dest) for relative, source, dest, _ in entries) == \
+           sorted((relative, str(source), dest) for relative, source, dest in expected)
+    if output_path is not None:
+        assert os.path.isdir(os.path.join(output_path, 'speaker2', 'deep'))
@@ -0,0 +1,102 @@
+import json
+import math
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from common.corpus_statistics import (CorpusAggregator, QuantileSketch, RunningStatistics, StreamingHistogram,
+                                      open_statistics_writer, read_statistics)
+
+FIELDNAMES = ['filename', 'noise_ratio', 'amount_of_skips']
+
+
+def rows(n=7):
+    rng = np.random.default_rng(0)
+    return [{'filename': Path(f'/corpus/speaker{i}/audio.wav'), 'noise_ratio': float(rng.random()), 'amount_of_skips': int(i)}
+            for i in range(n)]
+
+
+def write_and_read(filename, row_group_size=3):
+    writer = open_statistics_writer(str(filename), FIELDNAMES, row_group_size)
+    for row in rows():
+        writer.write(row)
+    writer.close()
+    return list(read_statistics(str(filename)))
+
+
+def expected_rows():
+    return [{**row, 'filename': str(row['filename'])} for row in rows()]
+
+
+def test_npz_round_trip(tmp_path):
+    assert write_and_read(tmp_path / 'statistics.npz') == expected_rows()
+
+
+def test_parquet_round_trip(tmp_path):
+    pytest.importorskip('pyarrow')
+    assert write_and_read(tmp_path / 'statistics.parquet') == expected_rows()
+
+
+def test_csv_round_trip_closes_the_file(tmp_path):
+    writer = open_statistics_writer(str(tmp_path / 'statistics.csv'), FIELDNAMES)
+    for row in rows():
+        writer.write(row)
+    writer.close()
+    assert writer.file.closed
+    assert list(read_statistics(str(tmp_path / 'statistics.csv'))) == expected_rows()
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_histogram_counts_every_value_in_its_bin(seed):
+    rng = np.random.default_rng(seed)
+    values = rng.normal(rng.uniform(-100, 100), rng.uniform(0.1, 50), size=500)
+    histogram = StreamingHistogram(bins=16)
+    for value in values:
+        histogram.add(value)
+
+    edges = np.array(histogram.edges())
+    assert histogram.counts.sum() == len(values)
+    assert edges[0] <= values.min() and values.max() < edges[-1]
+    # a value on the edge of two bins can fall on either side of it, with the float rounding.
+    misplaced = np.cumsum(histogram.counts - np.histogram(values, edges)[0])
+    assert np.max(np.abs(misplaced)) <= 2
+
+
+def test_quantiles_are_exact_while_the_sketch_is_not_full():
+    values = np.random.default_rng(0).random(100)
+    sketch = QuantileSketch(size=128)
+    for value in values:
+        sketch.add(value)
+    assert sketch.quantile(0.25) == np.quantile(values, 0.25)
+    assert math.isnan(QuantileSketch().quantile(0.5))
+
+
+def test_running_statistics_match_numpy():
+    values = np.random.default_rng(0).normal(3, 2, size=1000)
+    statistics = RunningStatistics()
+    for value in values:
+        statistics.add(value)
+    statistics.add(math.nan)
+
+    summary = statistics.summary()
+    assert summary['count'] == len(values)
+    assert summary['invalid'] == 1
+    assert summary['mean'] == pytest.approx(np.mean(values))
+    assert summary['variance'] == pytest.approx(np.var(values))
+    assert summary['min'] == np.min(values) and summary['max'] == np.max(values)
+
+
+def test_summary_writes_null_for_fields_without_values(tmp_path):
+    aggregator = CorpusAggregator(FIELDNAMES + ['f0mean'])
+    for row in rows():
+        aggregator.add({**row, 'f0mean': math.nan})
+    aggregator.write_summary(str(tmp_path / 'summary.json'))
+
+    with open(tmp_path / 'summary.json') as f:
+        summary = json.load(f)
+    assert summary['rows'] == 7
+    assert 'filename' not in summary['fields']
+    assert summary['fields']['amount_of_skips']['mean'] == 3
+    assert summary['fields']['f0mean']['invalid'] == 7
+    assert summary['fields']['f0mean']['mean'] is None
@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+from common import NoiseSuppressor
+from common.fast_crop import majority_filter
+
+SR = 44100
+
+
+def boolean_majority_filter(is_noise_pre, window_size):
+    ''' the original, per sample, filter of NoiseSuppressor. '''
+    return NoiseSuppressor()._NoiseSuppressor__boolean_majority_filter(is_noise_pre, window_size)
+
+
+@pytest.mark.parametrize('seed', range(200))
+def test_majority_filter_is_identical(seed):
+    rng = np.random.default_rng(seed)
+    window_size = int(rng.integers(1, 64))
+    # runs of random lengths, so there are both long runs and flickering votes
+    runs = rng.integers(1, 3 * window_size, size=int(rng.integers(1, 40)))
+    is_noise_pre = np.repeat(rng.random(len(runs)) < rng.random(), runs)
+    flips = rng.random(len(is_noise_pre)) < 0.05 * rng.random()
+    is_noise_pre ^= flips
+
+    assert np.array_equal(majority_filter(is_noise_pre, window_size), boolean_majority_filter(is_noise_pre, window_size))
+
+
+def synthetic_recording(seed, dtype):
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(rng.uniform(2, 4) * SR)) / SR
+    y = 10 ** rng.uniform(-3, -1.5) * rng.standard_normal(len(t))
+    for _ in range(rng.integers(1, 4)):
+        start = rng.uniform(0, t[-1])
+        end = start + rng.uniform(0.2, 1.0)
+        y += rng.uniform(0.05, 0.5) * np.sin(2 * np.pi * rng.uniform(100, 400) * t) * ((t >= start) & (t < end))
+    return y.astype(dtype)
+
+
+def crop(y, **kwargs):
+    ''' the cropped audio, or the type of the exception, which both versions must agree on. '''
+    try:
+        return NoiseSuppressor(noise_suppress=False, intra_file_parallelism=False, **kwargs).just_crop_ends(y, SR)
+    except Exception as e:
+        return type(e)
+
+
+def with_silence(y, seed, where):
+    ''' y with a run of digital silence at its start, middle or end, or silent everywhere. '''
+    rng = np.random.default_rng(seed)
+    y = y.copy()
+    length = int(rng.uniform(0.1, 0.8) * SR)
+    if where == 'start':
+        y[:length] = 0
+    elif where == 'middle':
+        start = int(rng.uniform(0.2, 0.6) * len(y))
+        y[start:start + length] = 0
+    elif where == 'end':
+        y[len(y) - length:] = 0
+    elif where == 'all':
+        y[:] = 0
+    return y
+
+
+@pytest.mark.parametrize('seed', range(6))
+@pytest.mark.parametrize('dtype', [np.float32, np.float64])
+@pytest.mark.parametrize('thresholds', [{}, {'noise_threshold_pct': 0.5}, {'noise_threshold_db': 10.0}])
+@pytest.mark.parametrize('silence', [None, 'start', 'middle', 'end', 'all'])
+def test_crop_bounds_is_identical(seed, dtype, thresholds, silence):
+    y = with_silence(synthetic_recording(seed, dtype), seed, silence)
+    expected = crop(y, **thresholds)
+    cropped = crop(y, fast_crop=True, **thresholds)
+    if isinstance(expected, type):
+        assert cropped is expected
+    else:
+        assert cropped.dtype == expected.dtype
+        assert np.array_equal(cropped, expected)
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from common import intra_file
+from common.intra_file import IntraFileParallelism, _chunk_bounds
+from common.noisereduce import reduce_noise
+
+SR = 8000
+
+
+def noisy_voice(seconds, seed=0):
+    ''' a tone that comes and goes over noise, with silence at both ends. '''
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * SR)) / SR
+    y = 0.01 * rng.standard_normal(len(t)) + 0.3 * np.sin(2 * np.pi * 220 * t) * (np.sin(2 * np.pi * 0.4 * t) > 0)
+    y[:SR // 4] = 0
+    y[-SR // 4:] = 0
+    return y
+
+
+@pytest.mark.parametrize('length, chunk', [(10, 3), (10, 4), (11, 3), (3, 5), (1, 1)])
+def test_chunk_bounds_cover_the_range(length, chunk):
+    bounds = _chunk_bounds(length, chunk)
+    assert bounds[0][0] == 0 and bounds[-1][1] == length
+    assert all(end == start for (_, end), (start, _) in zip(bounds, bounds[1:]))
+    assert all(end - start >= chunk // 2 for start, end in bounds)
+
+
+@pytest.mark.parametrize('chunk_seconds', [0.3, 1.0, 2.5])
+def test_sliding_convolution_is_exact(chunk_seconds):
+    y2 = noisy_voice(7.3) ** 2
+    window = np.ones(int(0.2 * SR))
+    parallelism = IntraFileParallelism(workers=3, chunk_seconds=chunk_seconds)
+    expected = np.convolve(y2, window)[len(window) - 1:]
+    np.testing.assert_array_equal(parallelism.sliding_convolution(y2, window, SR), expected)
+
+
+@pytest.mark.parametrize('seconds', [7.3, 9.0])
+@pytest.mark.parametrize('chunk_seconds', [0.5, 1.0, 2.5])
+def test_chunked_noise_reduction_matches_the_whole_file(seconds, chunk_seconds):
+    y = noisy_voice(seconds)
+    noise = y[SR // 4:SR]
+    parallelism = IntraFileParallelism(workers=3, chunk_seconds=chunk_seconds)
+
+    signal, residue = parallelism.reduce_noise(y, noise, SR, n_std_thresh=1.5, prop_decrease=0.9)
+    expected_signal, expected_residue = reduce_noise(audio_clip=y, noise_clip=noise, n_std_thresh=1.5, prop_decrease=0.9)
+
+    assert len(signal) == len(expected_signal) == len(y)
+    assert len(residue) == len(expected_residue)
+    # only the rounding of the mask smoothing differs between the chunks and the whole spectrogram
+    np.testing.assert_allclose(signal, expected_signal, rtol=0, atol=1e-9)
+    np.testing.assert_allclose(residue, expected_residue, rtol=0, atol=1e-9)
+
+
+def test_only_audios_much_longer_than_the_average_are_split(monkeypatch):
+    monkeypatch.setattr(intra_file, '_history', intra_file._AudioHistory())
+    parallelism = IntraFileParallelism(workers=4, min_seconds=60, long_factor=8, min_files=3)
+    monkeypatch.setattr(parallelism, 'available_workers', lambda: 4)
+
+    parallelism.observe(5 * SR, SR)
+    # until min_files audios are done, min_seconds alone decides
+    assert parallelism.should_split(60 * SR, SR)
+    for seconds in (10, 15, 30):
+        parallelism.observe(seconds * SR, SR)
+
+    # the average of the finished audios is 10s
+    assert not parallelism.should_split(59 * SR, SR)
+    assert not parallelism.should_split(79 * SR, SR)
+    assert parallelism.should_split(80 * SR, SR)
+
+    monkeypatch.setattr(parallelism, 'available_workers', lambda: 1)
+    assert not parallelism.should_split(80 * SR, SR)
@@ -0,0 +1,79 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from common import process_directory_raw
+from common.memory_governor import PROCESSING_RATE, MemoryGovernor, parse_size
+
+
+class RecordingGovernor(MemoryGovernor):
+    ''' remembers the most memory and jobs it ever admitted at once. '''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.peak_in_use = 0
+        self.peak_admitted = 0
+
+    def acquire(self, cost):
+        super().acquire(cost)
+        with self.condition:
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+            self.peak_admitted = max(self.peak_admitted, self.admitted)
+
+
+def slow_job(source_path, _dest_path):
+    time.sleep(0.2)
+    return source_path
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    for i in range(6):
+        sf.write(tmp_path / f'{i}.wav', np.zeros(PROCESSING_RATE), PROCESSING_RATE)
+    return tmp_path
+
+
+def test_parse_size():
+    assert parse_size('512') == 512
+    assert parse_size('1.5k') == 1536
+    assert parse_size('16G') == 16 << 30
+    assert parse_size(' 2MB ') == 2 << 20
+
+
+def test_estimate_from_the_header_or_the_whole_budget(corpus):
+    governor = MemoryGovernor(1 << 30, bytes_per_sample=10, base_bytes=1000)
+    assert governor.estimate(corpus / '0.wav') == 1000 + 10 * PROCESSING_RATE
+    assert governor.estimate(corpus / '0.wav', duration=2.0) == 1000 + 20 * PROCESSING_RATE
+    (corpus / 'broken.wav').write_bytes(b'not a wav')
+    assert governor.estimate(corpus / 'broken.wav') == 1 << 30
+
+
+def test_acquire_waits_for_memory():
+    governor = MemoryGovernor(100, bytes_per_sample=1)
+    governor.acquire(60)
+    admitted = threading.Event()
+    thread = threading.Thread(target=lambda: (governor.acquire(60), admitted.set()))
+    thread.start()
+    assert not admitted.wait(0.2)
+    governor.release(60)
+    assert admitted.wait(5)
+    thread.join()
+    # a job bigger than the budget runs, but alone
+    governor.release(60)
+    governor.acquire(500)
+    assert governor.in_use == 500
+
+
+@pytest.mark.parametrize('budget_files, expected', [(2.5, 2), (0.5, 1)])
+def test_files_in_flight_fit_the_budget(corpus, budget_files, expected):
+    cost = 1000 + PROCESSING_RATE
+    governor = RecordingGovernor(int(budget_files * cost), bytes_per_sample=1, base_bytes=1000)
+    futures = process_directory_raw([str(corpus)], None, slow_job, lambda *_: None, governor=governor)
+
+    assert len(futures) == 6 and all(future.exception() is None for future in futures)
+    assert governor.peak_admitted == expected
+    assert governor.peak_in_use <= max(governor.budget_bytes, cost)
+    assert (governor.in_use, governor.admitted) == (0, 0)
@@ -0,0 +1,90 @@
+import json
+
+import numpy as np
+import pytest
+
+from common.memory_profile import MemoryProfiler, memory_regressions, memory_report, read_records
+
+
+def record(pid, duration, traced, rss=None, error=None, stage='reduce_noise'):
+    return {
+        'file': f'{pid}-{duration}.wav', 'duration': duration, 'pid': pid, 'rss_peak_bytes': rss, 'error': error,
+        'stages': {stage: {'calls': 1, 'traced_peak_bytes': traced, 'rss_peak_bytes': rss}},
+    }
+
+
+def test_first_file_of_each_process_is_warm_up():
+    records = [
+        record(1, 10.0, 10 ** 9), record(1, 10.0, 1000), record(1, 20.0, 4000),
+        record(2, 10.0, 10 ** 9), record(2, 10.0, 3000),
+    ]
+    report = memory_report(records)
+    assert report['reduce_noise']['files'] == 3
+    assert report['reduce_noise']['traced_median'] == 200
+    assert report['reduce_noise']['traced_max'] == 300
+
+    assert memory_report(records, skip_first=False)['reduce_noise']['files'] == 5
+
+
+def test_a_failed_or_short_first_file_is_still_the_warm_up():
+    records = [record(1, 0.5, 10 ** 9), record(2, 10.0, 10 ** 9, error='boom'), record(1, 10.0, 1000), record(2, 10.0, 2000)]
+    assert memory_report(records)['reduce_noise']['files'] == 2
+
+
+def test_short_failed_and_unknown_duration_files_are_left_out():
+    records = [
+        record(1, 10.0, 0),
+        record(1, 1.0, 10 ** 9), record(1, 0.2, 10 ** 9), record(1, None, 10 ** 9),
+        record(1, 10.0, 10 ** 9, error='out of memory'), record(1, 10.0, 1000),
+    ]
+    report = memory_report(records)
+    assert report['reduce_noise']['files'] == 1
+    assert report['reduce_noise']['traced_max'] == 100
+    assert memory_report(records, min_duration=0.1)['reduce_noise']['files'] == 3
+
+
+def test_stages_without_rss_have_no_rss_figures():
+    report = memory_report([record(1, 10.0, 1000), record(1, 10.0, 1000, rss=5000), record(1, 10.0, 1000)])
+    assert report['reduce_noise']['rss_median'] == 500
+    assert memory_report([record(1, 10.0, 1000), record(1, 10.0, 1000)])['reduce_noise']['rss_median'] is None
+
+
+def test_regressions_only_report_growth_above_the_limit():
+    baseline = {'pyin': {'traced_median': 100.0, 'traced_p95': 200.0}, 'stft': {'traced_median': 100.0, 'traced_p95': 100.0}}
+    report = {
+        'pyin': {'traced_median': 119.0, 'traced_p95': 250.0},
+        'stft': {'traced_median': 100.0, 'traced_p95': None},
+        'load': {'traced_median': 10 ** 9, 'traced_p95': 10 ** 9},
+    }
+    problems = memory_regressions(report, baseline)
+    assert len(problems) == 1
+    assert problems[0].startswith('pyin: traced_p95 grew 25%')
+    assert memory_regressions(report, baseline, max_growth=0.3) == []
+
+
+def test_profiler_records_the_stages_of_each_file(tmp_path):
+    records_file = str(tmp_path / 'memory.jsonl')
+    profiler = MemoryProfiler(records_file)
+
+    with profiler.file('a.wav'):
+        profiler.observe(44100 * 2, 44100)
+        with profiler.stage('reduce_noise'):
+            with profiler.stage('stft'):
+                inner = np.ones(10 ** 6)
+            outer = np.ones(2 * 10 ** 6)
+        del inner, outer
+    with pytest.raises(ValueError):
+        with profiler.file('b.wav'):
+            with profiler.stage('load'):
+                raise ValueError('unreadable')
+    with profiler.stage('outside of a file'):
+        pass
+
+    a, b = read_records([records_file])
+    assert a['duration'] == 2.0 and a['error'] is None
+    assert a['stages']['stft']['traced_peak_bytes'] >= 8 * 10 ** 6
+    # the inner stage counts for the outer one
+    assert a['stages']['reduce_noise']['traced_peak_bytes'] >= 24 * 10 ** 6
+    assert b['error'] == 'unreadable' and b['stages']['load']['calls'] == 1
+    with open(records_file) as f:
+        assert all('outside of a file' not in json.loads(line)['stages'] for line in f)
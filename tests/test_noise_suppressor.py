@@ -0,0 +1,72 @@
+import warnings
+
+import numpy as np
+import pytest
+
+from common import NoiseSuppressor
+
+SR = 44100
+
+
+def voice_with_silence(seed=0, dropout=(1.8, 2.2), leading=0.7):
+    ''' 4s of a tone from 1s to 3s over faint noise, with a dropout of digital silence and leading silence. '''
+    rng = np.random.default_rng(seed)
+    t = np.arange(4 * SR) / SR
+    y = 0.003 * rng.standard_normal(len(t)) + 0.3 * np.sin(2 * np.pi * 200 * t) * ((t > 1) & (t < 3))
+    y[int(dropout[0] * SR):int(dropout[1] * SR)] = 0
+    y[:int(leading * SR)] = 0
+    return y
+
+
+def test_energy_of_silence_is_at_the_noise_floor():
+    y = voice_with_silence()
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        edB, edBmin, edBmax = NoiseSuppressor().noise_energy(y, SR)
+
+    assert np.all(np.isfinite(edB))
+    assert np.min(edB) == edBmin
+    # the loudest window is the tone, about 10 * log10(0.3 ** 2 / 2)
+    assert edBmax == pytest.approx(10 * np.log10(0.3 ** 2 / 2), abs=0.5)
+    # the silent windows are raised to the floor
+    assert np.all(edB[int(1.9 * SR):int(2.1 * SR)] == edBmin)
+    assert np.all(edB[:int(0.6 * SR)] == edBmin)
+
+
+def test_silence_is_noise():
+    is_noise, _ = NoiseSuppressor().noise_sel(voice_with_silence(), SR)
+
+    assert np.all(is_noise[:int(0.6 * SR)])
+    assert np.all(is_noise[int(1.9 * SR):int(2.1 * SR)])
+    assert not np.any(is_noise[int(1.2 * SR):int(1.7 * SR)])
+    assert not np.any(is_noise[int(2.3 * SR):int(2.8 * SR)])
+
+
+def test_audio_without_energy_is_all_noise():
+    is_noise, _ = NoiseSuppressor().noise_sel(np.zeros(3 * SR), SR)
+    assert np.all(is_noise)
+
+
+@pytest.mark.parametrize('seed', range(3))
+@pytest.mark.parametrize('silence', [False, True])
+def test_spectral_energy_agrees_with_the_sliding_window(seed, silence):
+    y = voice_with_silence(seed) if silence else voice_with_silence(seed, dropout=(0, 0), leading=0)
+    noise_suppressor = NoiseSuppressor()
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        energy = noise_suppressor.noise_energy(y, SR)
+        spectral = noise_suppressor.spectral_noise_energy(y, SR)
+
+    inner = slice(int(0.5 * SR), -int(0.5 * SR))
+    assert np.all(np.isfinite(spectral[0]))
+    # the windows differ in shape (hann frames against a box), so only their levels agree.
+    assert np.median(np.abs(energy[0] - spectral[0])[inner]) < 0.1
+    assert spectral[2] == pytest.approx(energy[2], abs=0.1)
+
+    is_noise, _ = noise_suppressor.noise_sel(y, SR, energy=energy)
+    spectral_is_noise, _ = noise_suppressor.noise_sel(y, SR, energy=spectral)
+    assert np.mean(is_noise == spectral_is_noise) > 0.98
+    if silence:
+        # the frames of a window reach half an fft further than the window itself.
+        assert np.all(spectral_is_noise[:int(0.55 * SR)])
+        assert np.all(spectral_is_noise[int(1.85 * SR):int(2.05 * SR)])
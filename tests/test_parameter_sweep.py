@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from common import NoiseSuppressor
+from common.parameter_sweep import ParameterSweep
+
+SR = 44100
+
+
+def recording(seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(3 * SR) / SR
+    y = 0.01 * rng.standard_normal(len(t))
+    y += 0.3 * np.sin(2 * np.pi * 180 * t) * ((t > 0.8) & (t < 2.2)) + 0.1 * np.sin(2 * np.pi * 530 * t) * ((t > 1.2) & (t < 1.6))
+    return y - np.mean(y)
+
+
+def test_every_setting_matches_noise_reduce_signal():
+    y = recording()
+    sweep = ParameterSweep({
+        # noise_threshold_db None falls back to noise_threshold_pct
+        'noise_threshold_db': [None, 12.0],
+        'noise_threshold_pct': [0.4],
+        'bool_filter_window_size': [None, 4410],
+        'std_threshold': [1.0, 1.5],
+        'suppresion_pct': [0.5, 1.0],
+    })
+    results = sweep.sweep_signal(y, SR)
+    assert [setting for setting, _, _ in results] == sweep.settings
+    assert len(results) == 16
+
+    for setting, reduced_y, _ in results:
+        expected, _ = NoiseSuppressor(**setting).noise_reduce_signal(y, SR)
+        assert len(reduced_y) == len(expected)
+        np.testing.assert_allclose(reduced_y, expected, rtol=0, atol=1e-7)
+
+
+def test_short_audios_are_returned_as_they_are():
+    y = recording()[:SR]
+    for setting, reduced_y, is_noise in ParameterSweep({'std_threshold': [1.0, 2.0]}).sweep_signal(y, SR):
+        assert reduced_y is y
+        assert not np.any(is_noise)
+
+
+def test_only_the_sweepable_parameters_can_be_swept():
+    with pytest.raises(Exception, match='cannot sweep over noise_suppress'):
+        ParameterSweep({'noise_suppress': [True, False]})
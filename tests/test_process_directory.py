@@ -0,0 +1,103 @@
+import asyncio
+import os
+import time
+from pathlib import Path
+
+import pytest
+
+from common.process_directory import aiter_process_directory_raw, iter_process_directory_raw
+
+FILES = 12
+
+
+def mark(source_path, dest_path):
+    ''' leaves a .started and a .finished file next to dest_path, failing on the files named bad. '''
+    Path(f'{dest_path}.started').touch()
+    time.sleep(0.05)
+    if Path(source_path).name.startswith('bad'):
+        raise ValueError(f'bad file {Path(source_path).name}')
+    Path(f'{dest_path}.finished').touch()
+    return Path(source_path).name
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    root = tmp_path / 'corpus'
+    (root / 'sub').mkdir(parents=True)
+    for i in range(FILES):
+        (root / ('sub' if i % 2 else '') / f'file{i}.wav').touch()
+    return root
+
+
+def marks(out_dir, suffix):
+    return sorted(path.name[:-len(suffix)] for path in Path(out_dir).rglob(f'*{suffix}'))
+
+
+def wait_for_marks(out_dir, suffix, count, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while len(marks(out_dir, suffix)) < count and time.monotonic() < deadline:
+        time.sleep(0.05)
+    # whatever else would run has time to start
+    time.sleep(0.3)
+    return marks(out_dir, suffix)
+
+
+def test_yields_every_file(corpus, tmp_path):
+    out_dir = str(tmp_path / 'out')
+    processed = list(iter_process_directory_raw([str(corpus)], out_dir, mark, max_pending=3))
+
+    assert sorted(file.result for file in processed) == sorted(f'file{i}.wav' for i in range(FILES))
+    assert all(file.exception is None for file in processed)
+    assert all(Path(file.dest_path).name == Path(file.source_path).name.split('.')[0] + '.cleaned.wav' for file in processed)
+
+
+def test_failures_are_yielded_with_their_exception(corpus, tmp_path):
+    (corpus / 'bad.wav').touch()
+    processed = {Path(file.source_path).name: file for file in iter_process_directory_raw([str(corpus)], str(tmp_path / 'out'), mark)}
+
+    assert len(processed) == FILES + 1
+    assert processed['bad.wav'].result is None
+    assert isinstance(processed['bad.wav'].exception, ValueError)
+    assert processed['file0.wav'].result == 'file0.wav'
+
+
+@pytest.mark.parametrize('max_pending', [1, 4])
+def test_no_more_than_max_pending_files_wait_to_be_consumed(corpus, tmp_path, max_pending):
+    out_dir = str(tmp_path / 'out')
+    results = iter_process_directory_raw([str(corpus)], out_dir, mark, max_pending=max_pending)
+    try:
+        next(results)
+        # one file was consumed, and max_pending - 1 were submitted since
+        assert len(wait_for_marks(out_dir, '.started', max_pending)) == max_pending
+        next(results)
+        assert len(wait_for_marks(out_dir, '.started', max_pending + 1)) == max_pending + 1
+    finally:
+        results.close()
+
+
+def test_closing_early_cancels_the_files_not_started(corpus, tmp_path):
+    out_dir = str(tmp_path / 'out')
+    results = iter_process_directory_raw([str(corpus)], out_dir, mark, max_pending=3)
+    for _ in results:
+        break
+    results.close()
+
+    started = marks(out_dir, '.started')
+    assert len(started) <= 3
+    # the files that started were waited for
+    assert marks(out_dir, '.finished') == started
+    time.sleep(0.3)
+    assert marks(out_dir, '.started') == started
+
+
+def test_async_iterator_yields_every_file(corpus, tmp_path):
+    async def collect(limit=None):
+        names = []
+        async for file in aiter_process_directory_raw([str(corpus)], str(tmp_path / 'out'), mark, max_pending=2):
+            names.append(file.result)
+            if len(names) == limit:
+                break
+        return names
+
+    assert sorted(asyncio.run(collect())) == sorted(f'file{i}.wav' for i in range(FILES))
+    assert len(asyncio.run(collect(limit=2))) == 2
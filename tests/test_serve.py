@@ -0,0 +1,122 @@
+import http.client
+import json
+import threading
+from http.server import ThreadingHTTPServer
+from queue import Full, Queue
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from serve import BatchingDispatcher, PendingJob, make_handler, run_batch
+
+SR = 44100
+
+
+@pytest.fixture
+def audio(tmp_path):
+    t = np.arange(3 * SR) / SR
+    y = 0.01 * np.random.default_rng(0).standard_normal(len(t)) + 0.3 * np.sin(2 * np.pi * 200 * t) * ((t > 1) & (t < 2))
+    filename = tmp_path / 'audio.wav'
+    sf.write(filename, y, SR)
+    return str(filename)
+
+
+def test_a_failed_job_does_not_fail_its_batch(audio, tmp_path):
+    results = run_batch([
+        ('suppress', {'source': audio, 'dest': str(tmp_path / 'out.wav'), 'options': {'noise_suppress': False}}),
+        ('suppress', {'source': str(tmp_path / 'missing.wav'), 'dest': str(tmp_path / 'missing.out.wav')}),
+        ('suppress', {'source': audio, 'dest': str(tmp_path / 'out.wav'), 'options': {'memory_profiler': 'x'}}),
+    ])
+    assert [ok for ok, _ in results] == [True, False, False]
+    assert 'unknown options memory_profiler' in results[2][1]
+    assert (tmp_path / 'out.wav').exists()
+
+
+def test_dispatcher_processes_the_jobs(audio, tmp_path):
+    dispatcher = BatchingDispatcher(workers=1, queue_size=8, batch_size=4, batch_wait=0.05, batch_max_bytes=1 << 30)
+    try:
+        jobs = [dispatcher.submit('suppress', {'source': audio, 'dest': str(tmp_path / f'{i}.wav'), 'options': {'noise_suppress': False}})
+                for i in range(3)]
+        jobs.append(dispatcher.submit('suppress', {'source': str(tmp_path / 'missing.wav'), 'dest': str(tmp_path / 'x.wav')}))
+        for job in jobs:
+            assert job.done.wait(60)
+    finally:
+        dispatcher.shutdown()
+
+    assert [job.ok for job in jobs] == [True, True, True, False]
+    assert all((tmp_path / f'{i}.wav').exists() for i in range(3))
+
+
+class FakeDispatcher:
+    ''' finishes every job at once with its params, or refuses it when full. '''
+
+    def __init__(self, full=False):
+        self.queue = Queue()
+        self.full = full
+        self.submitted = []
+
+    def submit(self, kind, params):
+        if self.full:
+            raise Full()
+        job = PendingJob(kind, params)
+        self.submitted.append(job)
+        job.finish(True, {'kind': kind})
+        return job
+
+
+@pytest.fixture
+def serve():
+    servers = []
+
+    def start(dispatcher):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(dispatcher, timeout=5))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server.server_address[1]
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def request(port, method, path, body=None):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    data = body if isinstance(body, bytes) or body is None else json.dumps(body).encode()
+    connection.request(method, path, body=data)
+    response = connection.getresponse()
+    result = response.status, json.loads(response.read()), response.getheader('Retry-After')
+    connection.close()
+    return result
+
+
+def test_handler_runs_valid_jobs(serve):
+    dispatcher = FakeDispatcher()
+    port = serve(dispatcher)
+
+    status, body, _ = request(port, 'POST', '/statistics', {'source': 'a.wav', 'options': {'noise_threshold_db': 10}})
+    assert (status, body) == (200, {'kind': 'statistics'})
+    assert request(port, 'GET', '/health')[:2] == (200, {'queued': 0})
+
+
+@pytest.mark.parametrize('path, body, status', [
+    ('/unknown', {'source': 'a.wav'}, 404),
+    ('/suppress', b'not json', 400),
+    ('/suppress', {'source': 'a.wav'}, 400),
+    ('/statistics', ['a.wav'], 400),
+    ('/statistics', {'source': 'a.wav', 'options': {'memory_profiler': 'records.jsonl'}}, 400),
+    ('/statistics', {'source': 'a.wav', 'options': {'not_an_option': 1}}, 400),
+    ('/statistics', {'source': 'a.wav', 'options': []}, 400),
+])
+def test_handler_refuses_invalid_requests(serve, path, body, status):
+    dispatcher = FakeDispatcher()
+    port = serve(dispatcher)
+    assert request(port, 'POST', path, body)[0] == status
+    assert dispatcher.submitted == []
+
+
+def test_handler_answers_503_when_the_queue_is_full(serve):
+    port = serve(FakeDispatcher(full=True))
+    status, _, retry_after = request(port, 'POST', '/statistics', {'source': 'a.wav'})
+    assert (status, retry_after) == (503, '1')
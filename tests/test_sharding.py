@@ -0,0 +1,71 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+import merge_shards
+from common.corpus_statistics import read_statistics
+
+SR = 44100
+GENERATE_STATISTICS = Path(__file__).resolve().parent.parent / 'cli' / 'generate_statistics.py'
+SHARDS = 3
+
+
+@pytest.fixture(scope='module')
+def corpus(tmp_path_factory):
+    ''' tone-in-noise recordings in nested folders, and one too short to be analyzed. '''
+    root = tmp_path_factory.mktemp('corpus')
+    rng = np.random.default_rng(0)
+    for i, folder in enumerate(['', 'a', 'a', 'b/c', 'b/c', 'b']):
+        t = np.arange(int(rng.uniform(2.6, 3.2) * SR)) / SR
+        y = 0.005 * rng.standard_normal(len(t)) + 0.3 * np.sin(2 * np.pi * rng.uniform(120, 250) * t) * ((t > 0.5) & (t < t[-1] - 0.5))
+        (root / folder).mkdir(parents=True, exist_ok=True)
+        sf.write(root / folder / f'{i}.wav', y, SR)
+    sf.write(root / 'short.wav', np.zeros(SR // 2), SR)
+    return root
+
+
+def generate_statistics(*args):
+    return subprocess.run([sys.executable, str(GENERATE_STATISTICS), *map(str, args)], capture_output=True, text=True)
+
+
+def by_filename(rows):
+    return sorted(rows, key=lambda row: row['filename'])
+
+
+def test_shards_cover_the_corpus_once_and_merge_like_a_single_run(corpus, tmp_path):
+    processes = [subprocess.Popen([sys.executable, str(GENERATE_STATISTICS), '--shard', f'{i}/{SHARDS}',
+                                   '--output', str(tmp_path / f'part{i}.csv'), str(corpus)],
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                 for i in range(SHARDS)]
+    assert [process.wait() for process in processes] == [0] * SHARDS
+
+    manifests = [tmp_path / f'part{i}.csv.manifest.json' for i in range(SHARDS)]
+    paths = []
+    for filename in manifests:
+        with open(filename) as f:
+            paths.extend(entry['path'] for entry in json.load(f)['files'])
+    corpus_files = [f'{corpus.name}/{path.relative_to(corpus).as_posix()}' for path in corpus.rglob('*.wav')]
+    assert sorted(paths) == sorted(corpus_files)
+
+    # the short file is rejected by the statistics, which only --allow-errors accepts.
+    merged = tmp_path / 'merged.csv'
+    assert merge_shards.main(['merge_shards.py', '--output', str(merged), *map(str, manifests)]) == 1
+    assert merge_shards.main(['merge_shards.py', '--allow-errors', '--output', str(merged), *map(str, manifests)]) == 0
+
+    single = tmp_path / 'single.csv'
+    assert generate_statistics('--output', single, corpus).returncode == 0
+    assert by_filename(read_statistics(str(merged))) == by_filename(read_statistics(str(single)))
+    assert len(list(read_statistics(str(single)))) == len(corpus_files) - 1
+
+
+def test_manifest_needs_output(corpus, tmp_path):
+    for args in (['--shard', '0/2'], ['--shard', '0/2', '--manifest', tmp_path / 'manifest.json']):
+        result = generate_statistics(*args, corpus)
+        assert result.returncode == 2
+        assert 'need --output' in result.stderr
+    assert not (tmp_path / 'manifest.json').exists()
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from common import NoiseSuppressor, StreamingSegmenter
+
+SR = 44100
+# the running noise floor only converges to the global one as the recording goes, so a few
+# samples next to the first transitions may be decided differently than by noise_sel.
+TOLERANCE = 0.001
+
+
+def synthetic_recording(seed):
+    ''' 6s of low noise with three tones, like words separated by pauses. '''
+    rng = np.random.default_rng(seed)
+    t = np.arange(6 * SR) / SR
+    y = 0.005 * rng.standard_normal(len(t))
+    for start, end in ((1.0, 2.0), (3.0, 3.8), (4.5, 5.2)):
+        y += 0.3 * np.sin(2 * np.pi * 220 * t) * ((t >= start) & (t < end))
+    return y
+
+
+def stream(y, chunk_size):
+    segmenter = StreamingSegmenter(SR)
+    intervals = []
+    for start in range(0, len(y), chunk_size):
+        intervals += segmenter.process(y[start:start + chunk_size])
+    return intervals + segmenter.flush()
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+@pytest.mark.parametrize('chunk_size', [1024, 4410, 44100, 6 * SR])
+def test_matches_offline_noise_sel(seed, chunk_size):
+    y = synthetic_recording(seed)
+    offline_is_noise, _ = NoiseSuppressor().noise_sel(y, SR)
+
+    coverage = np.zeros(len(y), dtype=int)
+    is_noise = np.zeros(len(y), dtype=bool)
+    for is_signal, start, end in stream(y, chunk_size):
+        assert 0 <= start < end <= len(y)
+        coverage[start:end] += 1
+        is_noise[start:end] = not is_signal
+
+    assert np.all(coverage == 1), 'every sample must be in exactly one interval'
+    mismatches = np.count_nonzero(is_noise != offline_is_noise)
+    if chunk_size >= len(y):
+        # fed at once, the floor is the global one, so the result is the same.
+        assert mismatches == 0
+    else:
+        assert mismatches <= TOLERANCE * len(y)
+
+
+def test_intervals_alternate():
+    intervals = stream(synthetic_recording(0), 4410)
+    for (previous, _, previous_end), (current, start, _) in zip(intervals, intervals[1:]):
+        assert previous != current
+        assert previous_end == start
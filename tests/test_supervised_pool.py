@@ -0,0 +1,124 @@
+import faulthandler
+import json
+import os
+import signal
+import time
+
+import pytest
+
+from common import process_directory_raw
+from common.supervised_pool import JobQuarantined, SupervisedPool, Supervision
+from common.telemetry import Telemetry
+
+
+def double(x):
+    return 2 * x
+
+
+def crash_once(marker, x):
+    ''' dies the first time it is called, and works on the retry. '''
+    if not os.path.exists(marker):
+        open(marker, 'w').close()
+        os.kill(os.getpid(), signal.SIGKILL)
+    return x
+
+
+def segfault(_):
+    # the workers inherit the faulthandler of pytest, which would dump their stack.
+    faulthandler.disable()
+    os.kill(os.getpid(), signal.SIGSEGV)
+
+
+def hang(_):
+    time.sleep(60)
+
+
+def fail(_):
+    raise ValueError('bad audio')
+
+
+def fail_once(marker, x):
+    if not os.path.exists(marker):
+        open(marker, 'w').close()
+        raise ValueError('bad luck')
+    return x
+
+
+def test_a_crashed_job_is_retried(tmp_path):
+    with SupervisedPool(2, supervision=Supervision(retries=1)) as pool:
+        crashed = pool.submit(crash_once, str(tmp_path / 'crashed'), 7)
+        others = [pool.submit(double, i) for i in range(5)]
+    assert crashed.result() == 7
+    assert [future.result() for future in others] == [0, 2, 4, 6, 8]
+
+
+def test_jobs_that_keep_failing_are_quarantined(tmp_path):
+    lost = []
+    quarantine_file = tmp_path / 'quarantine.jsonl'
+    supervision = Supervision(retries=1, job_timeout=1.0, quarantine_file=str(quarantine_file))
+    with SupervisedPool(2, supervision=supervision, on_worker_lost=lost.append) as pool:
+        crashing = pool.submit(segfault, 'crashing.wav')
+        hanging = pool.submit(hang, 'hanging.wav')
+        working = pool.submit(double, 21)
+
+    assert working.result() == 42
+    for future, description, error in [(crashing, 'crashing.wav', 'died'), (hanging, 'hanging.wav', 'timed out')]:
+        with pytest.raises(JobQuarantined) as quarantined:
+            future.result()
+        assert quarantined.value.description == description
+        assert quarantined.value.attempts == 2
+        assert all(error in message for message in quarantined.value.errors)
+
+    with open(quarantine_file) as f:
+        records = [json.loads(line) for line in f]
+    assert sorted(record['job'] for record in records) == ['crashing.wav', 'hanging.wav']
+    # each attempt lost its worker
+    assert len(lost) == 4
+
+
+def test_exceptions_propagate_without_retries(tmp_path):
+    with SupervisedPool(1) as pool:
+        failing = pool.submit(fail, 'a.wav')
+        failing_once = pool.submit(fail_once, str(tmp_path / 'once'), 1)
+        working = pool.submit(double, 1)
+    with pytest.raises(ValueError, match='bad audio'):
+        failing.result()
+    with pytest.raises(ValueError, match='bad luck'):
+        failing_once.result()
+    assert working.result() == 2
+
+
+def test_exceptions_are_retried_if_asked(tmp_path):
+    with SupervisedPool(1, supervision=Supervision(retries=1, retry_exceptions=True)) as pool:
+        failing = pool.submit(fail, 'a.wav')
+        failing_once = pool.submit(fail_once, str(tmp_path / 'once'), 1)
+    with pytest.raises(JobQuarantined, match='bad audio'):
+        failing.result()
+    assert failing_once.result() == 1
+
+
+def test_submit_after_shutdown_fails():
+    pool = SupervisedPool(1)
+    pool.shutdown()
+    with pytest.raises(RuntimeError):
+        pool.submit(double, 1)
+
+
+def hang_on_hanging(source_path, _dest_path):
+    if 'hanging' in str(source_path):
+        time.sleep(60)
+    return source_path
+
+
+def test_telemetry_forgets_the_workers_it_killed(tmp_path):
+    for name in ('hanging.wav', 'a.wav', 'b.wav'):
+        (tmp_path / name).write_bytes(b'')
+    telemetry = Telemetry()
+    futures = process_directory_raw([str(tmp_path)], None, hang_on_hanging, lambda *_: None, telemetry=telemetry,
+                                    supervision=Supervision(retries=1, job_timeout=1.0))
+
+    assert sum(isinstance(future.exception(), JobQuarantined) for future in futures) == 1
+    snapshot = telemetry.snapshot()
+    assert (snapshot['completed'], snapshot['failed'], snapshot['in_flight']) == (2, 1, 0)
+    assert len(telemetry.lost_pids) == 2
+    assert not telemetry.lost_pids & set(snapshot['workers'])
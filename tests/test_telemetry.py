@@ -0,0 +1,92 @@
+import os
+import time
+from concurrent.futures import Future
+
+import pytest
+
+from common import telemetry as telemetry_module
+from common.telemetry import Telemetry, init_worker, timed_call
+
+
+def finished(result=None, exception=None) -> Future:
+    future = Future()
+    if exception is None:
+        future.set_result(result)
+    else:
+        future.set_exception(exception)
+    return future
+
+
+def wait_for(telemetry, condition, timeout=5.0):
+    ''' the events go through a multiprocessing queue, which takes a moment to deliver them. '''
+    deadline = time.monotonic() + timeout
+    while True:
+        snapshot = telemetry.snapshot()
+        if condition(snapshot) or time.monotonic() > deadline:
+            return snapshot
+        time.sleep(0.01)
+
+
+def fail():
+    raise Exception('failed')
+
+
+@pytest.fixture
+def telemetry(tmp_path):
+    telemetry = Telemetry(metrics_file=str(tmp_path / 'metrics.prom'))
+    previous = telemetry_module._worker_events
+    init_worker(telemetry.events)
+    yield telemetry
+    init_worker(previous)
+
+
+def test_counts_completed_and_failed_jobs(telemetry, tmp_path):
+    for job_id in range(3):
+        telemetry.job_submitted(job_id, None, duration=2.5)
+
+    assert timed_call(0, lambda x: x + 1, 1) == 2
+    telemetry.job_done(0, finished(2))
+    with pytest.raises(Exception):
+        timed_call(1, fail)
+    telemetry.job_done(1, finished(exception=Exception('failed')))
+
+    snapshot = wait_for(telemetry, lambda snapshot: snapshot['workers'].get(os.getpid(), {}).get('jobs') == 2)
+    assert (snapshot['submitted'], snapshot['completed'], snapshot['failed']) == (3, 1, 1)
+    assert snapshot['audio_seconds'] == 2.5
+    assert (snapshot['in_flight'], snapshot['queued']) == (0, 1)
+    assert snapshot['workers'][os.getpid()]['errors'] == 1
+
+    telemetry.report()
+    with open(tmp_path / 'metrics.prom') as f:
+        metrics = f.read()
+    assert 'noise_reduce_files_completed_total 1\n' in metrics
+    assert 'noise_reduce_files_failed_total 1\n' in metrics
+    assert not os.path.exists(tmp_path / 'metrics.prom.tmp')
+
+
+def test_cancelled_jobs_are_not_counted(telemetry):
+    telemetry.job_submitted(0, None, duration=1.0)
+    future = Future()
+    future.cancel()
+    telemetry.job_done(0, future)
+    assert telemetry.snapshot()['submitted'] == 0
+
+
+def test_a_lost_worker_is_forgotten_with_its_job(telemetry):
+    telemetry.job_submitted(0, None, duration=1.0)
+    telemetry.events.put(('start', 0, 12345, time.time()))
+    assert wait_for(telemetry, lambda snapshot: snapshot['in_flight'] == 1)['in_flight'] == 1
+
+    telemetry.worker_lost(12345)
+    # an event the worker sent before dying is ignored
+    telemetry.events.put(('end', 0, 12345, time.time(), True))
+    time.sleep(0.1)
+    snapshot = telemetry.snapshot()
+    assert snapshot['in_flight'] == 0
+    assert 12345 not in snapshot['workers']
+
+    # the retry, on another worker, is tracked as usual
+    telemetry.events.put(('start', 0, 12346, time.time()))
+    assert wait_for(telemetry, lambda snapshot: snapshot['in_flight'] == 1)['in_flight'] == 1
+    telemetry.job_done(0, finished())
+    assert telemetry.snapshot()['in_flight'] == 0
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from common.wav2f0stats import crossfade_transitions
+
+
+def crossfade_loop(x, xnoise):
+    ''' the sample by sample crossfade that crossfade_transitions replaced. '''
+    xx = x.copy()
+    n = 1
+    while n < len(x) - 1:
+        if (xnoise[n] and not xnoise[n - 1]) or (xnoise[n - 1] and not xnoise[n]):
+            for i in range(-100, 101):
+                if (n + i) in range(len(xx)):
+                    xx[n + i] = xx[n + i] * abs(i) / 100
+            n = n + 99
+        n = n + 1
+    return xx
+
+
+def noise_mask(rng, length, mean_run):
+    ''' alternating runs of noise and signal with random lengths around mean_run. '''
+    runs = rng.integers(1, 2 * mean_run, size=length)
+    return (np.repeat(np.arange(len(runs)) % 2, runs)[:length] == 1) ^ rng.integers(0, 2, dtype=bool)
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('mean_run', [3, 60, 150, 2000])
+def test_crossfade_matches_the_loop(seed, mean_run):
+    rng = np.random.default_rng(seed)
+    x = rng.standard_normal(5000)
+    xnoise = noise_mask(rng, len(x), mean_run)
+    np.testing.assert_allclose(crossfade_transitions(x, xnoise), crossfade_loop(x, xnoise), rtol=1e-12)
+
+
+@pytest.mark.parametrize('transitions', [[1], [2, 50], [4998], [120, 4900, 4999], []])
+def test_crossfade_matches_the_loop_near_the_ends(transitions):
+    x = np.random.default_rng(0).standard_normal(5000)
+    xnoise = np.zeros(len(x), dtype=bool)
+    for n in transitions:
+        xnoise[n:] = ~xnoise[n:]
+    np.testing.assert_allclose(crossfade_transitions(x, xnoise), crossfade_loop(x, xnoise), rtol=1e-12)